@@ -0,0 +1,271 @@
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tracemalloc
+
+from jd_gemini_new import (
+    initial_state, copy_state, generate_moves, apply_move, forms_mill, get_mill_removals, is_terminal,
+    count_board_pieces
+)
+
+# Microbenchmarks for the hot paths of the rules engine in jd_gemini_new.py.
+#
+# Every benchmark is run on a fixed corpus of positions taken from seeded random games, split by game phase,
+# and reports calls per second and the peak memory allocated per call (from tracemalloc). Results can be
+# saved as a JSON baseline and later runs compared against it, so engine changes that make the players
+# slower are caught:
+#
+#     python bench.py --save baseline.json
+#     python bench.py --compare baseline.json
+
+# Seed of the random games the corpus is taken from
+CORPUS_SEED = 4341
+
+# Positions per game phase in the corpus
+CORPUS_SIZE = 50
+
+# Phases of the game the corpus covers, in the order they are reported
+PHASES = ["placement", "midgame", "mill", "flying"]
+
+# Each timing loop runs for at least this many seconds, the best of TIMING_REPEATS loops is kept
+MIN_TIME = 0.1
+TIMING_REPEATS = 3
+
+# Relative change in calls per second or bytes per call that counts as a regression
+TOLERANCE = 0.10
+
+
+#* @brief Works out which phase of the game a position belongs to for the corpus
+#*
+#* @param state current state of the game
+#* @param moves legal moves of the player to move
+#*
+#* @return name of the phase (see PHASES)
+def position_phase(state, moves):
+    if not state["hand"]["blue"] and not state["hand"]["orange"]:
+        if count_board_pieces(state, "blue") == 3 or count_board_pieces(state, "orange") == 3:
+            return "flying"
+    if any(removal != "r0" for source, dest, removal in moves):
+        return "mill" # The player to move can close a mill
+    if state["hand"]["blue"] or state["hand"]["orange"]:
+        return "placement"
+    return "midgame"
+
+
+#* @brief Builds the benchmark corpus by playing seeded random games
+#*
+#* @param size positions to collect for each phase
+#* @param seed seed of the random games
+#*
+#* @return dictionary of phase -> list of states
+def build_corpus(size=CORPUS_SIZE, seed=CORPUS_SEED):
+    rng = random.Random(seed)
+    corpus = {phase: [] for phase in PHASES}
+    for game in range(100 * size):
+        state = initial_state()
+        state["turn"] = "blue"
+        while not is_terminal(state):
+            moves = generate_moves(state, state["turn"])
+            phase = position_phase(state, moves)
+            if len(corpus[phase]) < size and rng.random() < 0.2:
+                corpus[phase].append(state)
+            state = apply_move(state, rng.choice(moves))
+        if all(len(states) == size for states in corpus.values()):
+            break
+    return corpus
+
+
+#* @brief Computes a fingerprint of the corpus, so results are only compared when they were run on the same positions
+#*
+#* @param corpus dictionary of phase -> list of states
+#*
+#* @return hex string
+def corpus_fingerprint(corpus):
+    fingerprint = 0
+    for phase in PHASES:
+        for state in corpus[phase]:
+            fingerprint = (fingerprint * 31 + state["hash"]) & (1 << 64) - 1
+    return "{:016x}".format(fingerprint)
+
+
+#* @brief Lists the calls a benchmark makes for a set of positions
+#*
+#* @param name benchmark name (see BENCHMARKS)
+#* @param states positions to run the benchmark on
+#*
+#* @return list of argument tuples
+def benchmark_calls(name, states):
+    calls = []
+    for state in states:
+        color = state["turn"]
+        opponent = "orange" if color == "blue" else "blue"
+        if name == "generate_moves":
+            calls.append((state, color))
+        elif name == "apply_move":
+            calls.extend((state, move) for move in generate_moves(state, color))
+        elif name == "forms_mill":
+            calls.extend((state["board"], pos, occ) for pos, occ in state["board"].items() if occ is not None)
+        elif name == "get_mill_removals":
+            calls.append((state, opponent))
+        else:
+            calls.append((state,))
+    return calls
+
+
+# Benchmark name -> function it times
+BENCHMARKS = {
+    "generate_moves": generate_moves,
+    "apply_move": apply_move,
+    "forms_mill": forms_mill,
+    "get_mill_removals": get_mill_removals,
+    "is_terminal": is_terminal,
+    "copy_state": copy_state
+}
+
+
+#* @brief Times a function over a list of calls
+#*
+#* @param function function to time
+#* @param calls list of argument tuples
+#* @param min_time seconds each timing loop runs for at least
+#*
+#* @return calls per second of the best timing loop
+def calls_per_second(function, calls, min_time=MIN_TIME):
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in calls:
+                function(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(TIMING_REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in calls:
+                function(*args)
+        best = min(best, time.perf_counter() - start)
+    return loops * len(calls) / best
+
+
+#* @brief Measures the peak memory a function allocates per call
+#*
+#* @param function function to measure
+#* @param calls list of argument tuples
+#*
+#* @return average over the calls of the peak bytes allocated during the call
+def bytes_per_call(function, calls):
+    total = 0
+    tracemalloc.start()
+    try:
+        for args in calls:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function(*args)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(calls)
+
+
+#* @brief Runs the benchmarks on every phase of the corpus
+#*
+#* @param corpus dictionary of phase -> list of states
+#* @param names benchmarks to run
+#* @param min_time seconds each timing loop runs for at least
+#*
+#* @return dictionary of benchmark -> phase -> {"ops_per_sec", "bytes_per_call"}
+def run_benchmarks(corpus, names, min_time=MIN_TIME):
+    results = {}
+    for name in names:
+        results[name] = {}
+        for phase in PHASES:
+            calls = benchmark_calls(name, corpus[phase])
+            if not calls:
+                continue
+            results[name][phase] = {
+                "ops_per_sec": calls_per_second(BENCHMARKS[name], calls, min_time),
+                "bytes_per_call": bytes_per_call(BENCHMARKS[name], calls)
+            }
+    return results
+
+
+#* @brief Compares results against a saved baseline
+#*
+#* @param results results from run_benchmarks
+#* @param baseline baseline loaded from a file saved with --save
+#* @param tolerance relative change that counts as a regression
+#*
+#* @return list of (benchmark, phase, description) for every regression
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for name, phases in results.items():
+        for phase, result in phases.items():
+            old = baseline["results"].get(name, {}).get(phase)
+            if old is None:
+                continue
+            if result["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+                regressions.append((name, phase, "{:.0f} calls/s, was {:.0f}".format(result["ops_per_sec"], old["ops_per_sec"])))
+            if result["bytes_per_call"] > old["bytes_per_call"] * (1 + tolerance) + 16:
+                regressions.append((name, phase, "{:.0f} bytes/call, was {:.0f}".format(result["bytes_per_call"], old["bytes_per_call"])))
+    return regressions
+
+
+#* @brief Prints a table of results, with the change from the baseline when there is one
+#*
+#* @param results results from run_benchmarks
+#* @param baseline baseline loaded from a file, or None
+#*
+#* @return void
+def print_results(results, baseline=None):
+    print("{:<18} {:<10} {:>14} {:>9} {:>12}".format("benchmark", "phase", "calls/s", "change", "bytes/call"))
+    for name, phases in results.items():
+        for phase, result in phases.items():
+            change = ""
+            old = baseline["results"].get(name, {}).get(phase) if baseline else None
+            if old:
+                change = "{:+.1f}%".format(100 * (result["ops_per_sec"] / old["ops_per_sec"] - 1))
+            print("{:<18} {:<10} {:>14,.0f} {:>9} {:>12.0f}".format(name, phase, result["ops_per_sec"], change, result["bytes_per_call"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Lasker Morris rules engine")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a JSON baseline, exit with status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative slowdown that counts as a regression")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds each timing loop runs for at least")
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    fingerprint = corpus_fingerprint(corpus)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["corpus"] != fingerprint:
+            sys.exit("{} was run on a different corpus, save a new baseline".format(args.compare))
+
+    results = run_benchmarks(corpus, args.only, args.min_time)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"corpus": fingerprint, "python": platform.python_version(), "results": results}, f, indent=2)
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for name, phase, description in regressions:
+            print("REGRESSION {} ({}): {}".format(name, phase, description))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+import sys
+import time
+import random
+from array import array
+
+from jd_gemini_new import (
+    VALID_SPACES, ADJACENCY, MILLS,
+    initial_state, parse_move as parse_move_tuple, move_to_string as move_tuple_to_string,
+    generate_moves as dict_generate_moves, apply_move as dict_apply_move,
+    forms_mill as dict_forms_mill, is_terminal as dict_is_terminal, compute_hash, count_pieces
+)
+
+# Compact game-state engine: each colour's pieces are kept as a 24-bit integer mask, where bit i is
+# set when the space VALID_SPACES[i] holds one of that colour's pieces. A position is a plain tuple
+#
+#     (blue_mask, orange_mask, blue_hand, orange_hand, mill_counter, turn)
+#
+# so copying a position is free and every rules query is a handful of integer operations.
+# Moves are packed into a single integer of three 5-bit square indices,
+#
+#     source | dest << 5 | removal << 10
+#
+# using HAND as the source of a placement and NO_REMOVAL when no opponent piece is taken, so move
+# lists fit in an array('H') and a move can index tables directly (see MOVE_CODES).
+
+BLUE = 0
+ORANGE = 1
+COLORS = ("blue", "orange")
+
+NUM_SQUARES = len(VALID_SPACES)
+FULL_BOARD = (1 << NUM_SQUARES) - 1
+
+# Index of every space name into the bit positions of a mask
+SQUARE_INDEX = {pos: i for i, pos in enumerate(VALID_SPACES)}
+
+# Sentinel square indices used inside moves (fit in the same 5 bits as a real square)
+HAND = 24
+NO_REMOVAL = 24
+
+# Number of distinct move codes, the size of a table indexed by move
+MOVE_CODES = 1 << 15
+
+# Every mill as a mask of its three squares
+MILL_MASKS = [sum(1 << SQUARE_INDEX[p] for p in mill) for mill in MILLS]
+
+# For each square, the masks of the other two squares of both mills running through it
+MILL_PARTNER_MASKS = [
+    tuple(mill & ~(1 << sq) for mill in MILL_MASKS if mill >> sq & 1) for sq in range(NUM_SQUARES)
+]
+
+# For each square, the mask of its neighbours derived from ADJACENCY
+NEIGHBOURS = [sum(1 << SQUARE_INDEX[n] for n in ADJACENCY[pos]) for pos in VALID_SPACES]
+
+#* @brief Iterates over the square indices set in a mask, lowest first (same order as VALID_SPACES)
+#*
+#* @param mask bitboard of squares
+#*
+#* @return generator of square indices
+def bit_squares(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+#* @brief Checks if a piece on the given square would complete a mill for the given mask
+#*
+#* @param mask bitboard of the player's pieces
+#* @param sq square index the piece is placed on
+#*
+#* @return boolean value indicating if the move forms a mill
+def forms_mill(mask, sq):
+    first, second = MILL_PARTNER_MASKS[sq]
+    return mask & first == first or mask & second == second
+
+
+#* @brief Lists all of the opponent's pieces that can be legally removed when player scores a mill
+#*
+#* @param opp_mask bitboard of the opponent's pieces
+#*
+#* @return list of square indices that can be legally removed
+def get_mill_removals(opp_mask):
+    removable = [sq for sq in bit_squares(opp_mask) if not forms_mill(opp_mask, sq)]
+    if removable:
+        return removable
+    return list(bit_squares(opp_mask))
+
+
+#* @brief Packs a move into its integer code
+#*
+#* @param source square index the piece comes from, or HAND
+#* @param dest square index the piece goes to
+#* @param removal square index of the removed opponent piece, or NO_REMOVAL
+#*
+#* @return move code
+def encode_move(source, dest, removal=NO_REMOVAL):
+    return source | dest << 5 | removal << 10
+
+
+#* @brief Converts a dictionary game state into a bitboard position
+#*
+#* @param state current state of the game
+#*
+#* @return position tuple
+def from_state(state):
+    blue = 0
+    orange = 0
+    for pos, occ in state["board"].items():
+        if occ == "blue":
+            blue |= 1 << SQUARE_INDEX[pos]
+        elif occ == "orange":
+            orange |= 1 << SQUARE_INDEX[pos]
+    turn = ORANGE if state["turn"] == "orange" else BLUE
+    return (blue, orange, state["hand"]["blue"], state["hand"]["orange"], state["mill_counter"], turn)
+
+
+#* @brief Converts a bitboard position back into a dictionary game state
+#*
+#* @param position position tuple
+#*
+#* @return state of the game in the dictionary format used by the players
+def to_state(position):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    board = {}
+    for i, pos in enumerate(VALID_SPACES):
+        if blue >> i & 1:
+            board[pos] = "blue"
+        elif orange >> i & 1:
+            board[pos] = "orange"
+        else:
+            board[pos] = None
+    state = {
+        "board": board,
+        "hand": {"blue": blue_hand, "orange": orange_hand},
+        "mill_counter": mill_counter,
+        "turn": COLORS[turn]
+    }
+    state["pieces"] = count_pieces(board)
+    state["hash"] = compute_hash(state)
+    return state
+
+
+#* @brief Converts a move code into the (source, dest, removal) string tuple used by the players
+#*
+#* @param move move code
+#* @param side player making the move (BLUE or ORANGE)
+#*
+#* @return tuple of the move in the form (source, dest, removal)
+def move_to_tuple(move, side):
+    source, dest, removal = move & 31, move >> 5 & 31, move >> 10
+    if source == HAND:
+        source_name = "h1" if side == BLUE else "h2"
+    else:
+        source_name = VALID_SPACES[source]
+    removal_name = "r0" if removal == NO_REMOVAL else VALID_SPACES[removal]
+    return (source_name, VALID_SPACES[dest], removal_name)
+
+
+#* @brief Converts a (source, dest, removal) string tuple into a move code
+#*
+#* Hot loops should index MOVE_CODE_OF instead, which holds the result for every possible tuple.
+#*
+#* @param move tuple of the form (source, dest, removal)
+#*
+#* @return move code
+def move_from_tuple(move):
+    source, dest, removal = move
+    source_sq = HAND if source.startswith("h") else SQUARE_INDEX[source]
+    removal_sq = NO_REMOVAL if removal == "r0" else SQUARE_INDEX[removal]
+    return source_sq | SQUARE_INDEX[dest] << 5 | removal_sq << 10
+
+
+# Move code of every (source, dest, removal) tuple the dictionary rules can produce, so the search can index
+# its tables by move without parsing the tuple each time
+MOVE_CODE_OF = {
+    (source, dest, removal): move_from_tuple((source, dest, removal))
+    for source in ["h1", "h2"] + VALID_SPACES for dest in VALID_SPACES for removal in ["r0"] + VALID_SPACES
+}
+
+
+#* @brief Converts a move from the referee's text form to a move code
+#*
+#* @param move_str string representation of the move
+#*
+#* @return move code
+def parse_move(move_str):
+    return move_from_tuple(parse_move_tuple(move_str))
+
+
+#* @brief Converts a move code to the referee's text form
+#*
+#* @param move move code
+#* @param side player making the move (BLUE or ORANGE)
+#*
+#* @return string representation of the move
+def move_to_string(move, side):
+    return move_tuple_to_string(move_to_tuple(move, side), COLORS[side])
+
+
+#* @brief Generates all possible moves the given player can make
+#*
+#* @param position position tuple
+#* @param side player to generate moves for, defaults to the player whose turn it is
+#*
+#* @return array of the move codes of all possible moves
+def generate_moves(position, side=None):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    if side is None:
+        side = turn
+    if side == BLUE:
+        own, opp, hand = blue, orange, blue_hand
+    else:
+        own, opp, hand = orange, blue, orange_hand
+    empty = FULL_BOARD & ~(blue | orange)
+    removals = None # Only worked out once a move forms a mill, which most positions have none of
+    moves = array("H")
+
+    # Possible moves from hand
+    if hand > 0:
+        for dest in bit_squares(empty):
+            if forms_mill(own, dest):
+                if removals is None:
+                    removals = get_mill_removals(opp)
+                step = HAND | dest << 5
+                for rem in removals:
+                    moves.append(step | rem << 10)
+            else:
+                moves.append(HAND | dest << 5 | NO_REMOVAL << 10)
+
+    # Possible moves of pieces on the board (flying when down to three pieces with an empty hand)
+    flying = hand == 0 and own.bit_count() == 3
+    for src in bit_squares(own):
+        rest = own ^ (1 << src)
+        dests = empty if flying else NEIGHBOURS[src] & empty
+        for dest in bit_squares(dests):
+            if forms_mill(rest, dest):
+                if removals is None:
+                    removals = get_mill_removals(opp)
+                step = src | dest << 5
+                for rem in removals:
+                    moves.append(step | rem << 10)
+            else:
+                moves.append(src | dest << 5 | NO_REMOVAL << 10)
+
+    return moves
+
+
+#* @brief Applies a given move, and returns the position after the move is applied
+#*
+#* @param position position tuple
+#* @param move move code
+#*
+#* @return the new position after the move is applied
+def apply_move(position, move):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    source, dest, removal = move & 31, move >> 5 & 31, move >> 10
+    if turn == BLUE:
+        own, opp, hand = blue, orange, blue_hand
+    else:
+        own, opp, hand = orange, blue, orange_hand
+
+    if source == HAND:
+        hand -= 1
+        own |= 1 << dest
+    else:
+        own = (own & ~(1 << source)) | (1 << dest)
+
+    if removal != NO_REMOVAL and forms_mill(own, dest):
+        opp &= ~(1 << removal)
+        mill_counter = 0
+    else:
+        mill_counter += 1
+
+    if turn == BLUE:
+        return (own, opp, hand, orange_hand, mill_counter, ORANGE)
+    return (opp, own, blue_hand, hand, mill_counter, BLUE)
+
+
+#* @brief Checks if the given player has at least one legal move, without generating the moves
+#*
+#* @param position position tuple
+#* @param side player to check, defaults to the player whose turn it is
+#*
+#* @return boolean value indicating if the player can move
+def has_any_move(position, side=None):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    if side is None:
+        side = turn
+    if side == BLUE:
+        own, opp, hand = blue, orange, blue_hand
+    else:
+        own, opp, hand = orange, blue, orange_hand
+    if not opp:
+        # A mill with nothing to remove gives no move, so only the full generator can tell
+        return bool(generate_moves(position, side))
+    empty = FULL_BOARD & ~(blue | orange)
+    if hand > 0 or own.bit_count() == 3:
+        return empty != 0
+    for src in bit_squares(own):
+        if NEIGHBOURS[src] & empty:
+            return True
+    return False
+
+
+#* @brief Checks if the position is terminal (no legal moves, a player has less than 3 pieces, or stalemate)
+#*
+#* @param position position tuple
+#*
+#* @return boolean value indicating if the game is over
+def is_terminal(position):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    if blue.bit_count() + blue_hand < 3 or orange.bit_count() + orange_hand < 3:
+        return True
+    if mill_counter >= 20:
+        return True
+    if not has_any_move(position):
+        return True
+    return False
+
+
+#* @brief Compares the bitboard engine against the dictionary rules for a single state
+#*
+#* @param state current state of the game
+#*
+#* @return list of descriptions of every disagreement found (empty when both engines agree)
+def cross_check(state):
+    problems = []
+    position = from_state(state)
+    if to_state(position)["board"] != state["board"]:
+        problems.append("board round trip differs")
+
+    for side, color in enumerate(COLORS):
+        board = state["board"]
+        own = position[side]
+        for i, pos in enumerate(VALID_SPACES):
+            if board[pos] is None and dict_forms_mill(board, pos, color) != forms_mill(own, i):
+                problems.append("forms_mill differs for {} at {}".format(color, pos))
+
+    side = position[5]
+    expected = sorted(dict_generate_moves(state, state["turn"]))
+    moves = generate_moves(position)
+    actual = sorted(move_to_tuple(move, side) for move in moves)
+    if expected != actual:
+        problems.append("generate_moves differs: {} vs {}".format(expected, actual))
+
+    for move in moves:
+        expected_state = dict_apply_move(state, move_to_tuple(move, side))
+        actual_state = to_state(apply_move(position, move))
+        for key in ("board", "hand", "pieces", "mill_counter", "turn", "hash"):
+            if expected_state[key] != actual_state[key]:
+                problems.append("apply_move differs on {} for {}".format(key, move_to_tuple(move, side)))
+
+    if dict_is_terminal(state) != is_terminal(position):
+        problems.append("is_terminal differs")
+    return problems
+
+
+#* @brief Plays random games with both engines side by side and reports any disagreement and the speed of each
+#*
+#* @param games number of random games to play
+#* @param seed seed for the random move choices
+#*
+#* @return number of states where the engines disagreed
+def run_cross_check(games=50, seed=0):
+    rng = random.Random(seed)
+    failures = 0
+    checked = 0
+    for _ in range(games):
+        state = initial_state()
+        state["turn"] = "blue"
+        while not dict_is_terminal(state):
+            problems = cross_check(state)
+            checked += 1
+            if problems:
+                failures += 1
+                print("Mismatch in state {}: {}".format(state, problems))
+            state = dict_apply_move(state, rng.choice(dict_generate_moves(state, state["turn"])))
+
+    start = time.perf_counter()
+    nodes = 0
+    for _ in range(games):
+        state = initial_state()
+        state["turn"] = "blue"
+        while not dict_is_terminal(state):
+            moves = dict_generate_moves(state, state["turn"])
+            nodes += len(moves)
+            state = dict_apply_move(state, rng.choice(moves))
+    dict_rate = nodes / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    nodes = 0
+    for _ in range(games):
+        position = from_state(initial_state())
+        while not is_terminal(position):
+            moves = generate_moves(position)
+            nodes += len(moves)
+            position = apply_move(position, rng.choice(moves))
+    bitboard_rate = nodes / (time.perf_counter() - start)
+
+    print("Checked {} states, {} mismatches".format(checked, failures))
+    print("dict engine: {:.0f} moves/s, bitboard engine: {:.0f} moves/s".format(dict_rate, bitboard_rate))
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run_cross_check() else 0)
@@ -0,0 +1,197 @@
+import os
+import queue
+import atexit
+import weakref
+import threading
+
+# Debug log for the player scripts, which cannot print anything but their moves to stdout.
+#
+# Messages are put on a bounded queue and written by a background thread in batches, with the file kept open
+# between them, so logging costs a player a queue append instead of an open/write/close on the referee's
+# clock. If the writer falls behind and the queue fills up, messages are dropped (and the number dropped is
+# written once it catches up) rather than blocking the move. The file is rotated once it grows past a size
+# limit, and messages below the log level are discarded before they are formatted. With logging turned off
+# the log function is a no-op.
+
+# Message levels, lowest first
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# Level names accepted on the command line; "off" turns logging off
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": None}
+
+# Size in bytes a log file may reach before it is rotated, and the number of rotated files kept
+MAX_BYTES = 1 << 20
+BACKUPS = 3
+
+# Messages waiting to be written before new ones are dropped
+QUEUE_SIZE = 10000
+
+# Most messages written at once
+BATCH_SIZE = 256
+
+# Seconds to wait for the writer to finish when the log is closed
+CLOSE_TIMEOUT = 2.0
+
+# Put on the queue to stop the writer
+_STOP = object()
+
+# Logs in use in this process, so a forked child can reset them (held weakly, so dropped logs are not kept alive)
+_logs = weakref.WeakSet()
+
+
+#* @brief Resets every log in a forked child, which gets a copy of their queues but not their writer threads
+#*
+#* @return void
+def _reset_logs():
+    for log in list(_logs):
+        log.reset()
+
+
+os.register_at_fork(after_in_child=_reset_logs)
+
+
+#* @brief Log function used when logging is off
+#*
+#* @param message message, or format string for args
+#* @param args values formatted into the message
+#* @param level level of the message
+#*
+#* @return void
+def disabled(message, *args, level=INFO):
+    pass
+
+
+class DebugLog:
+    #* @brief Creates a log; the file is opened and the writer started with the first message
+    #*
+    #* @param path file to write to
+    #* @param level messages below this level are discarded
+    #* @param max_bytes size the file may reach before it is rotated
+    #* @param backups rotated files kept, as path.1 (newest) to path.<backups>
+    #* @param queue_size messages waiting to be written before new ones are dropped
+    def __init__(self, path, level=INFO, max_bytes=MAX_BYTES, backups=BACKUPS, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.level = level
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue_size = queue_size
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        _logs.add(self)
+
+    #* @brief Logs a message
+    #*
+    #* @param message message, or format string for args (only formatted if the message is logged)
+    #* @param args values formatted into the message
+    #* @param level level of the message
+    #*
+    #* @return void
+    def write(self, message, *args, level=INFO):
+        if level < self.level:
+            return
+        if args:
+            message = message.format(*args)
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    #* @brief Starts the writer thread, unless another thread just did
+    #*
+    #* @return void
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                thread = threading.Thread(target=self.run, name="debug-log", daemon=True)
+                thread.start()
+                atexit.register(self.close)
+                self.thread = thread
+
+    #* @brief Forgets the writer thread and the queued messages of the parent process, in a forked child
+    #*
+    #* @return void
+    def reset(self):
+        self.queue = queue.Queue(self.queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    #* @brief Writer thread: writes the queued messages in batches until the log is closed
+    #*
+    #* @return void
+    def run(self):
+        f = open(self.path, "a", encoding="utf-8")
+        size = f.tell() # Byte offset, the file is opened at its end
+        try:
+            stop = False
+            while not stop:
+                batch = [self.queue.get()]
+                while len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if _STOP in batch:
+                    stop = True
+                    batch = [message for message in batch if message is not _STOP]
+                if self.dropped:
+                    dropped, self.dropped = self.dropped, 0
+                    batch.append("({} log messages dropped, the log queue was full)".format(dropped))
+                if not batch:
+                    continue
+                text = "\n".join(batch) + "\n"
+                f.write(text)
+                f.flush()
+                size += len(text.encode("utf-8")) # max_bytes is in bytes, not characters
+                if size > self.max_bytes:
+                    f.close()
+                    self.rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+                    size = 0
+        finally:
+            f.close()
+
+    #* @brief Renames the log file to path.1, shifting the older rotated files up and dropping the oldest
+    #*
+    #* @return void
+    def rotate(self):
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists("{}.{}".format(self.path, n)):
+                os.replace("{}.{}".format(self.path, n), "{}.{}".format(self.path, n + 1))
+        os.replace(self.path, self.path + ".1")
+
+    #* @brief Writes the queued messages and stops the writer
+    #*
+    #* @return void
+    def close(self):
+        thread = self.thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self.queue.put(_STOP, timeout=CLOSE_TIMEOUT)
+        except queue.Full:
+            return
+        thread.join(CLOSE_TIMEOUT)
+
+
+#* @brief Returns the function to log messages with
+#*
+#* @param path file to write to
+#* @param level name of the lowest level logged (see LEVELS), "off" to turn logging off
+#* @param max_bytes size the file may reach before it is rotated
+#*
+#* @return function taking (message, *args, level=INFO)
+def open_log(path, level="info", max_bytes=MAX_BYTES):
+    if LEVELS[level] is None:
+        return disabled
+    return DebugLog(path, LEVELS[level], max_bytes).write
@@ -67,6 +67,9 @@ MILLS = [
     ["e4", "f4", "g4"]
 ]
 
+# The two mills through each space, stored as the pair of other spaces in each mill (so a mill check is two lookups)
+MILL_PARTNERS = {pos: [tuple(p for p in mill if p != pos) for mill in MILLS if pos in mill] for pos in VALID_SPACES}
+
 # Flag for immediate mode evaluation (possible mills on next move)
 IMMEDIATE_MODE = False
 
@@ -98,11 +101,9 @@ def initial_state():
 #*
 #* @return boolean value indicating if the move forms a mill
 def forms_mill(board, pos, color):
-    for mill in MILLS:
-        if pos in mill:
-            if all(board[p] == color or p == pos for p in mill):
-                if all((p == pos) or (board[p] == color) for p in mill):
-                    return True
+    for first, second in MILL_PARTNERS[pos]:
+        if board[first] == color and board[second] == color:
+            return True
     return False
 
 
@@ -114,13 +115,10 @@ def forms_mill(board, pos, color):
 #*
 #* @return boolean value indicating if the move blocks the opponent's mill
 def blocks_mill(board, pos, opp_color):
-    for mill in MILLS:
-        if pos in mill:
-            # Exclude the position 'pos' where we just played.
-            other_positions = [p for p in mill if p != pos]
-            # Since each mill is three positions, there will be exactly two others.
-            if len(other_positions) == 2 and all(board[p] == opp_color for p in other_positions):
-                return True
+    # The other two positions of each mill through 'pos' where we just played.
+    for first, second in MILL_PARTNERS[pos]:
+        if board[first] == opp_color and board[second] == opp_color:
+            return True
     return False
 
 
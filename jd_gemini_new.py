@@ -1,10 +1,14 @@
 import sys
 import time
+import argparse
 import random
 import re
-import copy
-from google import genai
-from google.genai.errors import ClientError
+import atexit
+import collections
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import debug_log
+from debug_log import DEBUG, WARNING
 
 # Global constants for storing game background
 
@@ -67,11 +71,73 @@ MILLS = [
     ["e4", "f4", "g4"]
 ]
 
+# The two mills through each space, stored as the pair of other spaces in each mill (so a mill check is two lookups)
+MILL_PARTNERS = {pos: [tuple(p for p in mill if p != pos) for mill in MILLS if pos in mill] for pos in VALID_SPACES}
+
+# Random 64-bit keys for Zobrist hashing of a game state: the hash is the XOR of the key for every piece on the
+# board, each player's hand count, the mill_counter bucket and (when it is orange's turn) the side to move
+ZOBRIST_SEED = 4341
+_zobrist_random = random.Random(ZOBRIST_SEED)
+ZOBRIST_PIECES = {pos: {color: _zobrist_random.getrandbits(64) for color in ("blue", "orange")} for pos in VALID_SPACES}
+ZOBRIST_HAND = {color: [_zobrist_random.getrandbits(64) for _ in range(11)] for color in ("blue", "orange")}
+ZOBRIST_MILL_COUNTER = [_zobrist_random.getrandbits(64) for _ in range(9)]
+ZOBRIST_ORANGE_TURN = _zobrist_random.getrandbits(64)
+
+# Number of mill_counter values sharing a hash, and the count from which each value has its own
+MILL_COUNTER_BUCKET = 4
+EXACT_MILL_COUNTER = 16
+
+# Share of the per-move time limit Gemini requests (with their retries) may use, the rest is kept for
+# checking the answer and sending the move
+LLM_TIME_MARGIN = 0.8
+
+# Seconds allowed for sending the rules to Gemini before the game starts
+SETUP_TIME = 10.0
+
+# Version of the prompt formats, part of the key of cached answers: bump it when a prompt changes
+PROMPT_VERSION = 1
+
+# How far below the search's own move (in evaluation points, 100 per piece) Gemini's move may score and still
+# be played in hybrid mode
+HYBRID_MAX_LOSS = 50
+
+# How the moves of the Gemini and hybrid players were decided in this process, read by tournament.py:
+# "answered" and "cached" moves came from Gemini, "no answer", "invalid" and "outscored" ones are fallbacks
+LLM_MOVES = collections.Counter()
+
+
+# File the debug log is written to by default (the referee reads our stdout, so nothing else can go there)
+DEBUG_LOG_PATH = "debuggg.txt"
 
 # USED FOR DEBUGGING TO SEPARATE TEXT FILE TO NOT CONFUSE REFEREE WITH STDOUT
-def log_debug(message):
-    with open("debuggg.txt", "a") as f:
-        f.write(message + "\n")
+# log_debug(message, *args, level=INFO) queues a message for the debug log's writer thread (see debug_log.py);
+# configure_logging replaces it with the log chosen on the command line
+log_debug = debug_log.open_log(DEBUG_LOG_PATH)
+
+
+#* @brief Sets up the debug log from the command line options
+#*
+#* @param args parsed command line arguments
+#*
+#* @return void
+def configure_logging(args):
+    global log_debug
+    log_debug = debug_log.open_log(args.log_file, args.log_level, args.log_max_bytes)
+
+
+#* @brief Adds the debug log options to a command line parser
+#*
+#* @param parser argparse.ArgumentParser to add the options to
+#* @param level name of the log level used when none is given
+#*
+#* @return void
+def add_log_arguments(parser, level="info"):
+    parser.add_argument("--log-file", default=DEBUG_LOG_PATH, help="file the debug log is written to")
+    parser.add_argument("--log-level", choices=list(debug_log.LEVELS), default=level,
+                        help="lowest level of message written to the debug log, off to turn it off")
+    parser.add_argument("--log-max-bytes", type=int, default=debug_log.MAX_BYTES,
+                        help="size the debug log may reach before it is rotated")
+
 
 #* @brief Read Gemini API key from a git hidden text file
 #* 
@@ -93,9 +159,57 @@ def initial_state():
         "mill_counter": 0, # Used to count to 20 for stalemate
         "turn": None  
     }
+    state["pieces"] = {"blue": 0, "orange": 0} # Kept up to date by make_move so counts never need a board scan
+    state["hash"] = compute_hash(state)
     return state
 
 
+#* @brief Groups mill_counter values so states only a move or two apart on the stalemate count share a hash
+#*
+#* Counts from EXACT_MILL_COUNTER on, close enough to the stalemate for a search to reach it, each get their own.
+#*
+#* @param mill_counter moves since the last mill
+#*
+#* @return bucket index into ZOBRIST_MILL_COUNTER
+def mill_counter_bucket(mill_counter):
+    if mill_counter >= EXACT_MILL_COUNTER:
+        return min(mill_counter, 20) - EXACT_MILL_COUNTER + EXACT_MILL_COUNTER // MILL_COUNTER_BUCKET
+    return mill_counter // MILL_COUNTER_BUCKET
+
+
+#* @brief Checks if a search of the given depth can reach the stalemate from some mill_counter sharing the hash
+#*
+#* The score of such a search depends on the exact count, which the hash does not hold, so it must not be
+#* shared through the transposition table.
+#*
+#* @param mill_counter moves since the last mill
+#* @param depth remaining depth of the search
+#*
+#* @return boolean value indicating if the score depends on more of mill_counter than its hash holds
+def mill_counter_ambiguous(mill_counter, depth):
+    if mill_counter >= EXACT_MILL_COUNTER:
+        return False
+    return mill_counter // MILL_COUNTER_BUCKET * MILL_COUNTER_BUCKET + MILL_COUNTER_BUCKET - 1 + depth >= 20
+
+
+#* @brief Computes the Zobrist hash of a game state from scratch (make_move keeps it up to date afterwards)
+#*
+#* @param state current state of the game
+#*
+#* @return 64-bit hash of the game state
+def compute_hash(state):
+    key = 0
+    for pos, occ in state["board"].items():
+        if occ is not None:
+            key ^= ZOBRIST_PIECES[pos][occ]
+    for color in ("blue", "orange"):
+        key ^= ZOBRIST_HAND[color][state["hand"][color]]
+    key ^= ZOBRIST_MILL_COUNTER[mill_counter_bucket(state["mill_counter"])]
+    if state["turn"] == "orange":
+        key ^= ZOBRIST_ORANGE_TURN
+    return key
+
+
 #* @brief Checks if the move will form a mill
 #*
 #* @param board current state of the board
@@ -104,11 +218,24 @@ def initial_state():
 #*
 #* @return boolean value indicating if the move forms a mill
 def forms_mill(board, pos, color):
-    for mill in MILLS:
-        if pos in mill:
-            if all(board[p] == color or p == pos for p in mill):
-                if all((p == pos) or (board[p] == color) for p in mill):
-                    return True
+    for first, second in MILL_PARTNERS[pos]:
+        if board[first] == color and board[second] == color:
+            return True
+    return False
+
+
+#* @brief Checks if moving a piece from source to dest will form a mill, without copying the board
+#*
+#* @param board current state of the board
+#* @param source position the piece leaves (None when placing from hand)
+#* @param dest position of the move
+#* @param color color of the player
+#*
+#* @return boolean value indicating if the move forms a mill
+def forms_mill_from(board, source, dest, color):
+    for first, second in MILL_PARTNERS[dest]:
+        if first != source and second != source and board[first] == color and board[second] == color:
+            return True
     return False
 
 
@@ -126,13 +253,17 @@ def get_mill_removals(state, opponent_color):
     return [pos for pos, occ in board.items() if occ == opponent_color]
 
 
-#* @brief Creates a deep copy of the given game state to test out moves without affecting the real game
+#* @brief Creates a copy of the given game state to test out moves without affecting the real game
 #*
 #* @param state current state of the game
 #*
-#* @return copy of given game state
+#* @return copy of given game state (only the board, hand and pieces are nested, so a shallow copy of each is enough)
 def copy_state(state):
-    return copy.deepcopy(state)
+    new_state = dict(state)
+    new_state["board"] = state["board"].copy()
+    new_state["hand"] = state["hand"].copy()
+    new_state["pieces"] = state["pieces"].copy()
+    return new_state
 
 
 #* @brief Changes the state of the game between player turns
@@ -151,7 +282,20 @@ def change_turn(state):
 #*
 #* @return number of pieces the player has
 def count_board_pieces(state, color):
-    return sum(1 for occ in state["board"].values() if occ == color)
+    return state["pieces"][color]
+
+
+#* @brief Counts the pieces of each color by scanning the board, for states built without make_move
+#*
+#* @param board current state of the board
+#*
+#* @return dictionary of the number of pieces of each color
+def count_pieces(board):
+    pieces = {"blue": 0, "orange": 0}
+    for occ in board.values():
+        if occ is not None:
+            pieces[occ] += 1
+    return pieces
 
 #* @brief Generates all possible moves the given player can make
 #*
@@ -163,38 +307,35 @@ def generate_moves(state, color):
     moves = []
     board = state["board"]
     opponent_color = "blue" if color == "orange" else "orange"
-    pieces_on_board = count_board_pieces(state, color)
     pieces_in_hand = state["hand"][color]
+    empty_positions = [pos for pos in VALID_SPACES if board[pos] is None]
+    removals = None # Only worked out once a move forms a mill
     
     # Possible moves from hand
     if pieces_in_hand > 0:
         hand_source = "h1" if color == "blue" else "h2"  # Use h1 for blue, h2 for orange (fixes h vs h2 error)
-        for pos in VALID_SPACES:
-            if board[pos] is None:
-                new_board = board.copy()
-                new_board[pos] = color
-                mill_formed = forms_mill(new_board, pos, color)
-                if mill_formed:
+        for pos in empty_positions:
+            if forms_mill(board, pos, color):
+                if removals is None:
                     removals = get_mill_removals(state, opponent_color)
-                    for rem in removals:
-                        moves.append((hand_source, pos, rem))
-                else:
-                    moves.append((hand_source, pos, "r0"))
+                for rem in removals:
+                    moves.append((hand_source, pos, rem))
+            else:
+                moves.append((hand_source, pos, "r0"))
     
     # Possible moves from adjacent moves
-    player_positions = [pos for pos, occ in board.items() if occ == color]
-    for src in player_positions:
-        if pieces_on_board == 3 and pieces_in_hand == 0:
-            possible_dests = [p for p in VALID_SPACES if board[p] is None]
+    flying = count_board_pieces(state, color) == 3 and pieces_in_hand == 0
+    for src in VALID_SPACES:
+        if board[src] != color:
+            continue
+        if flying:
+            possible_dests = empty_positions
         else:
             possible_dests = [p for p in ADJACENCY[src] if board[p] is None]
         for dest in possible_dests:
-            new_board = board.copy()
-            new_board[src] = None
-            new_board[dest] = color
-            mill_formed = forms_mill(new_board, dest, color)
-            if mill_formed:
-                removals = get_mill_removals(state, opponent_color)
+            if forms_mill_from(board, src, dest, color):
+                if removals is None:
+                    removals = get_mill_removals(state, opponent_color)
                 for rem in removals:
                     moves.append((src, dest, rem))
             else:
@@ -203,40 +344,199 @@ def generate_moves(state, color):
     return moves
 
 
-#* @brief Applies a given move, and returns the game state after the move is applied
+#* @brief Generates the same moves as generate_moves one at a time, best candidates first
+#*
+#* Moves that form a mill come first, then moves that block an opponent's two-in-a-row, then quiet moves.
+#* Removal targets are only worked out when the first mill move is asked for, so a consumer that stops
+#* early (an alpha-beta cutoff) never builds moves it does not look at.
+#*
+#* @param state current state of the game
+#* @param color color of the player
+#* @param killers moves to try first within the blocking and quiet groups (e.g. killer moves of the search)
+#* @param history function giving the history score of a move, higher scores are tried earlier within each group
+#*
+#* @return generator of moves in the form (source, dest, removal)
+def generate_ordered_moves(state, color, killers=(), history=None):
+    board = state["board"]
+    opponent_color = "blue" if color == "orange" else "orange"
+    pieces_in_hand = state["hand"][color]
+    empty_positions = [pos for pos in VALID_SPACES if board[pos] is None]
+    mills, blocks, quiet = [], [], []
+
+    # Sort every (source, dest) step into its group, the source is None for a placement from hand
+    steps = []
+    if pieces_in_hand > 0:
+        steps.extend((None, pos) for pos in empty_positions)
+    flying = count_board_pieces(state, color) == 3 and pieces_in_hand == 0
+    for src in VALID_SPACES:
+        if board[src] == color:
+            if flying:
+                steps.extend((src, dest) for dest in empty_positions)
+            else:
+                steps.extend((src, dest) for dest in ADJACENCY[src] if board[dest] is None)
+    for src, dest in steps:
+        if forms_mill_from(board, src, dest, color):
+            mills.append((src, dest))
+        elif forms_mill(board, dest, opponent_color):
+            blocks.append((src, dest))
+        else:
+            quiet.append((src, dest))
+
+    hand_source = "h1" if color == "blue" else "h2"
+    if mills:
+        removals = get_mill_removals(state, opponent_color)
+        for src, dest in mills:
+            for rem in removals:
+                yield (src or hand_source, dest, rem)
+
+    for group in (blocks, quiet):
+        group = [(src or hand_source, dest, "r0") for src, dest in group]
+        if history is not None:
+            group.sort(key=lambda move: (move not in killers, -history(move)))
+        elif killers:
+            group.sort(key=lambda move: move not in killers)
+        yield from group
+
+
+#* @brief Checks if the given player has at least one legal move, stopping at the first one found
+#*
+#* @param state current state of the game
+#* @param color color of the player
+#*
+#* @return boolean value indicating if the player can move
+def has_any_move(state, color):
+    board = state["board"]
+    opponent_color = "blue" if color == "orange" else "orange"
+    if count_board_pieces(state, opponent_color) == 0:
+        # A mill with nothing to remove gives no move, so only the full generator can tell
+        return bool(generate_moves(state, color))
+
+    pieces_in_hand = state["hand"][color]
+    if pieces_in_hand > 0 or count_board_pieces(state, color) == 3:
+        # Placing or flying can reach any open space
+        return any(occ is None for occ in board.values())
+    for src in VALID_SPACES:
+        if board[src] == color:
+            for dest in ADJACENCY[src]:
+                if board[dest] is None:
+                    return True
+    return False
+
+
+#* @brief Checks if a move is legal for the player whose turn it is, without generating every move
 #*
 #* @param state current state of the game
 #* @param move tuple of the form (source, dest, removal)
 #*
-#* @return the new state of the game after the move is applied
-def apply_move(state, move):
-    new_state = copy_state(state)
-    board = new_state["board"]
+#* @return boolean value indicating if the move is one of generate_moves' moves
+def is_legal_move(state, move):
+    if len(move) != 3:
+        return False
     source, dest, removal = move
+    board = state["board"]
     color = state["turn"]
     opponent_color = "blue" if color == "orange" else "orange"
-    mill_formed = False
+    pieces_in_hand = state["hand"][color]
+
+    if dest not in board or board[dest] is not None:
+        return False
+    if source == ("h1" if color == "blue" else "h2"):
+        if pieces_in_hand == 0:
+            return False
+        source = None
+    elif source not in board or board[source] != color:
+        return False
+    elif dest not in ADJACENCY[source] and not (count_board_pieces(state, color) == 3 and pieces_in_hand == 0):
+        return False
+
+    if forms_mill_from(board, source, dest, color):
+        return removal in get_mill_removals(state, opponent_color)
+    return removal == "r0"
+
+
+#* @brief Applies a given move to the game state in place, recording what is needed to take it back
+#*
+#* @param state current state of the game (modified)
+#* @param move tuple of the form (source, dest, removal)
+#*
+#* @return undo record (move, removed piece, previous hand count, previous mill_counter, previous turn, previous move_played, previous hash)
+def make_move(state, move):
+    board = state["board"]
+    source, dest, removal = move
+    color = state["turn"]
+    hand = state["hand"][color]
+    mill_counter = state["mill_counter"]
+    key = state["hash"]
+    undo = (move, None, hand, mill_counter, color, state.get("move_played"), key)
 
     if source.startswith("h"):
-        new_state["hand"][color] -= 1
-        board[dest] = color
-        if forms_mill(board, dest, color):
-            mill_formed = True
+        state["hand"][color] = hand - 1
+        state["pieces"][color] += 1
+        key ^= ZOBRIST_HAND[color][hand] ^ ZOBRIST_HAND[color][hand - 1]
     else:
         board[source] = None
-        board[dest] = color
-        if forms_mill(board, dest, color):
-            mill_formed = True
-
-    if mill_formed and removal != "r0":
+        key ^= ZOBRIST_PIECES[source][color]
+    board[dest] = color
+    key ^= ZOBRIST_PIECES[dest][color]
+
+    if removal != "r0" and forms_mill(board, dest, color):
+        removed = board[removal]
+        undo = (move, removed) + undo[2:]
+        if removed is not None:
+            state["pieces"][removed] -= 1
+            key ^= ZOBRIST_PIECES[removal][removed]
         board[removal] = None
-        new_state["mill_counter"] = 0
+        state["mill_counter"] = 0
+    else:
+        state["mill_counter"] = mill_counter + 1
+    key ^= ZOBRIST_MILL_COUNTER[mill_counter_bucket(mill_counter)]
+    key ^= ZOBRIST_MILL_COUNTER[mill_counter_bucket(state["mill_counter"])]
+
+    state["move_played"] = dest
+
+    change_turn(state)
+    state["hash"] = key ^ ZOBRIST_ORANGE_TURN
+    return undo
+
+
+#* @brief Takes back a move applied by make_move, restoring the game state exactly
+#*
+#* @param state current state of the game (modified)
+#* @param undo record returned by make_move
+#*
+#* @return void
+def unmake_move(state, undo):
+    board = state["board"]
+    (source, dest, removal), removed, hand, mill_counter, color, move_played, key = undo
+
+    if removed is not None:
+        board[removal] = removed
+        state["pieces"][removed] += 1
+    board[dest] = None
+    if source.startswith("h"):
+        state["pieces"][color] -= 1
     else:
-        new_state["mill_counter"] += 1
+        board[source] = color
+
+    state["hand"][color] = hand
+    state["mill_counter"] = mill_counter
+    state["turn"] = color
+    state["hash"] = key
+    if move_played is None:
+        state.pop("move_played", None)
+    else:
+        state["move_played"] = move_played
 
-    new_state["move_played"] = dest
 
-    change_turn(new_state)
+#* @brief Applies a given move, and returns the game state after the move is applied
+#*
+#* @param state current state of the game
+#* @param move tuple of the form (source, dest, removal)
+#*
+#* @return the new state of the game after the move is applied
+def apply_move(state, move):
+    new_state = copy_state(state)
+    make_move(new_state, move)
     return new_state
 
 
@@ -249,10 +549,10 @@ def is_terminal(state):
     for color in ["blue", "orange"]:
         if count_board_pieces(state, color) + state["hand"][color] < 3:
             return True
-    if not generate_moves(state, state["turn"]):
-        return True
     if state["mill_counter"] >= 20:
         return True
+    if not has_any_move(state, state["turn"]):
+        return True
     return False
 
 
@@ -320,6 +620,182 @@ def make_gemini_prompt(state, color, opp_move):
     return board_info
 
 
+#* @brief Draws the board as ASCII art, with a letter for each piece and the lines between adjacent spaces
+#*
+#* @param board current state of the board
+#*
+#* @return multi-line string, row 7 at the top and the column letters underneath
+def draw_board(board):
+    marks = {"blue": "B", "orange": "O", None: "."}
+    grid = [[" "] * 13 for _ in range(13)]
+    for pos in VALID_SPACES:
+        col, row = ord(pos[0]) - ord("a"), 7 - int(pos[1])
+        grid[2 * row][2 * col] = marks[board[pos]]
+        for neighbor in ADJACENCY[pos]:
+            n_col, n_row = ord(neighbor[0]) - ord("a"), 7 - int(neighbor[1])
+            if n_row == row:
+                for x in range(2 * min(col, n_col) + 1, 2 * max(col, n_col)):
+                    grid[2 * row][x] = "-"
+            else:
+                for y in range(2 * min(row, n_row) + 1, 2 * max(row, n_row)):
+                    grid[y][2 * col] = "|"
+    lines = []
+    for y, cells in enumerate(grid):
+        label = str(7 - y // 2) if y % 2 == 0 else " "
+        lines.append((label + " " + "".join(cells)).rstrip())
+    lines.append("  a b c d e f g")
+    return "\n".join(lines)
+
+
+#* @brief Creates a short version of the rules for the compact prompt format, which lists the legal moves every turn
+#*
+#* @param color color of our player
+#*
+#* @return string of the rules
+def make_compact_rules(color):
+    hand = "h1" if color == "blue" else "h2"
+    return ("You are playing Lasker Morris (Nine Men's Morris, but pieces on the board may move before the hand is empty; "
+            "10 pieces each; a mill of 3 in a line removes an opponent piece; a player with 3 pieces flies; "
+            "2 pieces loses; 20 moves without a mill is a draw). You are {}. Each turn you get the board "
+            "(B = blue, O = orange, . = empty) and the list of legal moves as 'source destination removal' "
+            "({} = from hand, r0 = no removal). Answer with one legal move in parentheses, e.g. ({} d2 r0), "
+            "and nothing else.").format(color, hand, hand)
+
+
+#* @brief Creates the per-move prompt in the compact format: a board diagram and the legal moves
+#*
+#* @param state current state of the game
+#* @param color color of our player
+#* @param opp_move opponent's last move
+#*
+#* @return string of the prompt
+def make_compact_prompt(state, color, opp_move):
+    opponent_color = "blue" if color == "orange" else "orange"
+    if isinstance(opp_move, tuple):
+        opp_move = " ".join(opp_move)
+    moves = " | ".join(move_to_string(move, color) for move in generate_moves(state, color))
+    return "{}\nHand: you {}, opponent {}. Opponent played: {}\nLegal: {}".format(
+        draw_board(state["board"]), state["hand"][color], state["hand"][opponent_color], opp_move, moves)
+
+
+#* @brief Creates the rules for the indexed prompt format, where Gemini picks a move by its number in the legal move list
+#*
+#* @param color color of our player
+#*
+#* @return string of the rules
+def make_indexed_rules(color):
+    return ("You are playing Lasker Morris (Nine Men's Morris, but pieces on the board may move before the hand is empty; "
+            "10 pieces each; a mill of 3 in a line removes an opponent piece; a player with 3 pieces flies; "
+            "2 pieces loses; 20 moves without a mill is a draw). You are {}. Each turn you get the board "
+            "(B = blue, O = orange, . = empty) and a numbered list of your legal moves as 'source destination removal' "
+            "(h1/h2 = from hand, r0 = no removal). Answer with only the number of the best move.").format(color)
+
+
+#* @brief Creates the per-move prompt in the indexed format: a board diagram and the numbered legal moves
+#*
+#* @param state current state of the game
+#* @param color color of our player
+#* @param opp_move opponent's last move
+#*
+#* @return string of the prompt
+def make_indexed_prompt(state, color, opp_move):
+    opponent_color = "blue" if color == "orange" else "orange"
+    if isinstance(opp_move, tuple):
+        opp_move = " ".join(opp_move)
+    moves = "\n".join("{}: {}".format(i, move_to_string(move, color)) for i, move in enumerate(generate_moves(state, color), 1))
+    return "{}\nHand: you {}, opponent {}. Opponent played: {}\n{}".format(
+        draw_board(state["board"]), state["hand"][color], state["hand"][opponent_color], opp_move, moves)
+
+
+#* @brief Returns a function that reads a streamed answer chunk by chunk and spots the first legal move in it
+#*
+#* Each chunk only checks the parentheses closed since the last one, and the text of a move is taken from the
+#* last "(" before its ")", so an answer cut short and retried does not hide the move that follows.
+#*
+#* @param state current state of the game
+#*
+#* @return function taking the text of the next chunk and returning the first legal move in parentheses
+#*         found so far, or None
+def make_move_stream_parser(state):
+    text = ""
+    scanned = 0 # every ")" before this index has been checked
+
+    def feed(chunk):
+        nonlocal text, scanned
+        text += chunk
+        while True:
+            end = text.find(")", scanned)
+            if end < 0:
+                return None
+            start = text.rfind("(", scanned, end)
+            scanned = end + 1
+            if start >= 0:
+                move = tuple(text[start + 1:end].split())
+                if is_legal_move(state, move):
+                    return move
+
+    return feed
+
+
+#* @brief Reads a move written out in parentheses from Gemini's answer
+#*
+#* @param state current state of the game
+#* @param answer text of Gemini's answer
+#*
+#* @return move tuple (not yet validated), or None if there is none
+def parse_move_answer(state, answer):
+    move = extract_move_from_gemini(answer)
+    return tuple(move) if move else None
+
+
+# Answers accepted by parse_index_answer: a bare number or {"index": number}, with optional surrounding whitespace
+INDEX_ANSWER = re.compile(r'\s*(?:(\d+)|\{\s*"index"\s*:\s*(\d+)\s*\})\s*')
+
+# JSON schema of the answer Gemini is asked for with --json-answer
+INDEX_ANSWER_SCHEMA = {"type": "OBJECT", "properties": {"index": {"type": "INTEGER"}}, "required": ["index"]}
+
+#* @brief Reads the number of a move from Gemini's answer to an indexed prompt
+#*
+#* The answer must be just the number, or the JSON object {"index": number} when --json-answer is used;
+#* anything else is rejected rather than guessed at.
+#*
+#* @param state current state of the game
+#* @param answer text of Gemini's answer
+#*
+#* @return move tuple from the numbered list, or None if the answer is not a valid number
+def parse_index_answer(state, answer):
+    match = INDEX_ANSWER.fullmatch(answer)
+    if match is None:
+        return None
+    index = int(match.group(1) or match.group(2))
+    moves = generate_moves(state, state["turn"])
+    if 1 <= index <= len(moves):
+        return moves[index - 1]
+    return None
+
+
+# Prompt formats Gemini can be given, selected with --prompt:
+# (rules sent once, board update sent every move, function reading the move from an answer)
+PROMPT_FORMATS = {
+    "verbose": (make_lasker_morris_rules, make_gemini_prompt, parse_move_answer),
+    "compact": (make_compact_rules, make_compact_prompt, parse_move_answer),
+    "indexed": (make_indexed_rules, make_indexed_prompt, parse_index_answer)
+}
+
+
+#* @brief Logs how many tokens a Gemini request used, from the usage metadata of the response
+#*
+#* @param label what the request was for
+#* @param response response from the Gemini SDK
+#*
+#* @return void
+def log_token_usage(label, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        log_debug("{} tokens: prompt {}, answer {}, total {}",
+                  label, usage.prompt_token_count, usage.candidates_token_count, usage.total_token_count)
+
+
 #* @brief Extracts the move from Gemini AI's response
 #*
 #* @param response The full response string from Gemini AI
@@ -339,9 +815,11 @@ def extract_move_from_gemini(response):
 #*
 #* @return Boolean indicating whether the move is valid
 def validate_move(state, move):
+    if is_legal_move(state, move):
+        return True
     possible_moves = generate_moves(state, state["turn"])
-    log_debug(f"Valid moves: {possible_moves}") 
-    return move in possible_moves
+    log_debug("Valid moves: {}", possible_moves, level=DEBUG)
+    return False
 
 
 #* @brief Handles move correction if an invalid move is detected
@@ -366,58 +844,469 @@ def generate_fallback_random_move(state):
 #*
 #* @param state The current game state
 #* @param gemini_response The response from Gemini AI containing the suggested move
+#* @param parse_answer function reading the move from the response (see PROMPT_FORMATS)
+#* @param cache llm_cache.AnswerCache to store a valid move in, or None
 #*
 #* @return the valid AI generated move OR a fallback move
-def process_gemini_response(state, gemini_response):
-    move = tuple(extract_move_from_gemini(gemini_response))
+def process_gemini_response(state, gemini_response, parse_answer=parse_move_answer, cache=None):
+    move = parse_answer(state, gemini_response)
     if not move or not validate_move(state, tuple(move)):
+        LLM_MOVES["invalid"] += 1
         fallback_move = generate_fallback_random_move(state)
-        log_debug("**********LLM move invalid. Using fallback move: {}".format(fallback_move)) 
-        log_debug(f"Invalid move detected: {move}") 
+        log_debug("**********LLM move invalid. Using fallback move: {}", fallback_move, level=WARNING)
+        log_debug("Invalid move detected: {}", move, level=WARNING)
 
         return fallback_move
+    LLM_MOVES["answered"] += 1
+    if cache is not None:
+        cache.store(state, tuple(move))
     return move
 
+#* @brief Creates the client the LLM players send their requests through, with the backend chosen on the command line
+#*
+#* @param args parsed command line arguments
+#*
+#* @return llm_client.GeminiClient talking to Gemini, or to the offline stand-in from mock_llm.py
+def make_llm_client(args):
+    # Imported here, as google-genai is only needed by the LLM players
+    import llm_client
+    import mock_llm
+
+    if args.llm_backend == "mock":
+        recording = mock_llm.load_recording(args.mock_replay) if args.mock_replay else None
+        backend = mock_llm.MockBackend(args.mock_latency, args.mock_jitter, args.mock_rate_limit, args.mock_malformed, recording, args.seed)
+        return llm_client.GeminiClient(None, mock_llm.MOCK_MODEL, args.request_timeout, args.max_attempts, backend=backend)
+    return llm_client.GeminiClient(read_api_key(), request_timeout=args.request_timeout, max_attempts=args.max_attempts)
+
+
+#* @brief Sets up the Gemini chat with the game rules and returns a function that sends it each board update
+#*
+#* @param player_color color of our player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move, deadline) and returning Gemini's answer, or None if
+#*         no answer arrived before the deadline; its close attribute closes the client
+def make_gemini_chat(player_color, args):
+    # Imported here, as google-genai is only needed by the LLM players
+    import llm_client
+    import mock_llm
+
+    make_rules, make_prompt, parse_answer = PROMPT_FORMATS[args.prompt]
+    # With --json-answer the model is held to INDEX_ANSWER_SCHEMA by the SDK's structured output
+    answer_schema = INDEX_ANSWER_SCHEMA if args.json_answer else None
+    lasker_morris_instructions = make_rules(player_color)
+
+    client = make_llm_client(args)
+    if args.stateless:
+        # The rules go with every request as the system instruction (or cached content), not as a chat message
+        chat = client.start_stateless(lasker_morris_instructions, args.cache_rules, time.time() + SETUP_TIME)
+        rules_sent = True
+        log_debug("Stateless Gemini session, rules sent as {}", next(iter(chat.options)))
+    else:
+        chat = client.start_chat()
+        rules_sent = False
+        try:
+            response = chat.send(lasker_morris_instructions, time.time() + SETUP_TIME)
+            rules_sent = True
+            log_debug("FIRST GEMINI CONTACT: {} \n ----------------------------------- \n", response.text)
+            log_token_usage("Rules", response)
+        except llm_client.LLMError as e:
+            log_debug("Could not send the rules to Gemini, they go with the first move instead: {}", e, level=WARNING)
+
+    def ask(state, opp_move, deadline):
+        nonlocal rules_sent
+        board_update = make_prompt(state, player_color, opp_move)
+        if not rules_sent:
+            board_update = lasker_morris_instructions + "\n\n" + board_update
+        log_debug("Move request: {} characters", len(board_update))
+        try:
+            if args.stream:
+                answer = read_streamed_move(state, board_update, deadline)
+            else:
+                response = chat.send(board_update, deadline, answer_schema)
+                answer = response.text
+                log_debug("Raw move ({} attempts): {}\n", client.attempts, answer)
+                log_token_usage("Move", response)
+        except llm_client.LLMError as e:
+            log_debug("Gemini request failed: {}", e, level=WARNING)
+            return None
+        rules_sent = True
+        if args.llm_record:
+            mock_llm.record_answer(args.llm_record, board_update, answer)
+        return answer
+
+    def read_streamed_move(state, board_update, deadline):
+        feed = make_move_stream_parser(state)
+        move = None
+
+        def on_text(chunk):
+            nonlocal move
+            move = feed(chunk)
+            return move is not None
+
+        text = chat.stream(board_update, on_text, deadline, answer_schema)
+        log_debug("Streamed move ({} attempts, {} characters read): {}\n", client.attempts, len(text), text)
+        if move is not None:
+            return "({} {} {})".format(*move) # Only the move, the explanation after it was never read
+        return text
+
+    ask.close = client.close
+    return ask
+
+
+#* @brief Opens the cache of Gemini's answers for the prompt format in use
+#*
+#* @param args parsed command line arguments
+#*
+#* @return llm_cache.AnswerCache, or None if caching is turned off or the cache file cannot be used
+def make_answer_cache(args):
+    if args.no_llm_cache:
+        return None
+    # Imported here, as llm_cache imports bitboard, which imports this module
+    import llm_cache
+    import llm_client
+    import mock_llm
+
+    model = mock_llm.MOCK_MODEL if args.llm_backend == "mock" else llm_client.DEFAULT_MODEL
+    prompt_version = "{}:{}".format(args.prompt, PROMPT_VERSION)
+    cache = llm_cache.open_cache(model, prompt_version, args.llm_cache or llm_cache.CACHE_PATH, args.llm_cache_ttl)
+    if cache is None:
+        log_debug("Could not open the Gemini answer cache, answers will not be cached", level=WARNING)
+    return cache
+
+
+#* @brief Looks up Gemini's cached answer for a position
+#*
+#* @param cache llm_cache.AnswerCache, or None
+#* @param state current state of the game
+#*
+#* @return the cached move if there is one and it is legal, otherwise None
+def cached_answer(cache, state):
+    if cache is None:
+        return None
+    move = cache.lookup(state)
+    if move is not None and is_legal_move(state, move):
+        log_debug("Cached Gemini move: {}", move)
+        return move
+    return None
+
+
+#* @brief Sets up the Gemini chat with the game rules and returns a function that asks it for each move
+#*
+#* @param player_color color of our player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning our move
+def make_gemini_player(player_color, args):
+    ask = make_gemini_chat(player_color, args)
+    cache = make_answer_cache(args)
+
+    def choose_move(state, opp_move):
+        move = cached_answer(cache, state)
+        if move is not None:
+            LLM_MOVES["cached"] += 1
+            return move
+        answer = ask(state, opp_move, time.time() + args.time_limit * LLM_TIME_MARGIN)
+        if answer is None:
+            LLM_MOVES["no answer"] += 1
+            fallback_move = generate_fallback_random_move(state)
+            log_debug("No answer from Gemini. Using fallback move: {}", fallback_move, level=WARNING)
+            return fallback_move
+        return process_gemini_response(state, answer, PROMPT_FORMATS[args.prompt][2], cache)
+
+    def close():
+        ask.close()
+        if cache is not None:
+            cache.close()
+
+    choose_move.close = close
+    return choose_move
+
+
+#* @brief Returns a function that picks each move with iterative-deepening alpha-beta search within the time limit
+#*
+#* @param player_color color of our player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning our move
+def make_search_player(player_color, args):
+    # Imported here, as search and tablebase (through bitboard) import this module
+    import search
+    import tablebase
+
+    table = search.TranspositionTable()
+    endgames = tablebase.Tablebase(args.tablebase_dir or tablebase.TABLE_DIR)
+    ponderer = search.Ponderer(args.time_limit, table, endgames) if args.ponder else None
+
+    def choose_move(state, opp_move):
+        start = time.time()
+        move = None
+        if ponderer is not None:
+            ponderer.stop()
+            move = ponderer.lookup(state)
+            if move is not None:
+                log_debug("Ponder hit: {}", move)
+        if move is None:
+            # Waiting for the ponderer to stop comes out of the time for this move
+            time_left = args.time_limit - (time.time() - start)
+            move = search.iterative_deepening(state, time_left, table=table, tablebase=endgames)
+        if ponderer is not None and move is not None:
+            # Search the opponent's likely replies while they think (the move is printed as soon as we return)
+            ponderer.start(apply_move(state, move))
+        return move
+
+    if ponderer is not None:
+        choose_move.close = ponderer.stop
+    return choose_move
+
+
+#* @brief Returns a function that asks Gemini and runs a local search at the same time for each move
+#*
+#* The search runs until the given fraction of the time limit, or less if the next depth would not finish by
+#* then, and Gemini's answer is waited for until the same time. Gemini's move (or its cached answer for the
+#* position, which skips the request) is played if it arrived by then, is legal and, searched to the same
+#* depth, scores no more than HYBRID_MAX_LOSS below the search's own move; otherwise the search's move is played.
+#*
+#* @param player_color color of our player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning our move
+def make_hybrid_player(player_color, args):
+    # Imported here, as search and tablebase (through bitboard) import this module
+    import search
+    import tablebase
+
+    ask = make_gemini_chat(player_color, args)
+    cache = make_answer_cache(args)
+    table = search.TranspositionTable()
+    endgames = tablebase.Tablebase(args.tablebase_dir or tablebase.TABLE_DIR)
+    gemini = ThreadPoolExecutor(max_workers=1) # One request at a time, the chat keeps a single history
+
+    def choose_move(state, opp_move):
+        start = time.time()
+        decision_time = start + args.time_limit * args.hybrid_fraction
+        gemini_move = cached_answer(cache, state)
+        source = "cached"
+        request = None
+        if gemini_move is None:
+            source = "answered"
+            request = gemini.submit(ask, copy_state(state), opp_move, decision_time)
+
+        searcher = search.Searcher(decision_time, None, table, endgames)
+        search_move, search_score, depth = searcher.iterative_deepening(state)
+        if depth == 0:
+            if request is not None:
+                request.cancel() # Not needed, and must not queue ahead of the next move's request
+            return search_move # Tablebase move, or the search had no time at all
+
+        if request is not None:
+            # The search may stop before decision_time, Gemini gets the rest of the time until then
+            try:
+                answer = request.result(timeout=max(0, decision_time - time.time()))
+            except TimeoutError:
+                request.cancel() # Only cancels a request still queued, a running one gives up at decision_time
+                answer = None
+            if answer is None:
+                LLM_MOVES["no answer"] += 1
+                log_debug("Hybrid: no Gemini answer in time, playing search move {}", search_move)
+                return search_move
+            gemini_move = PROMPT_FORMATS[args.prompt][2](state, answer)
+            if not gemini_move or not is_legal_move(state, tuple(gemini_move)):
+                LLM_MOVES["invalid"] += 1
+                log_debug("Hybrid: Gemini move {} invalid, playing search move {}", gemini_move, search_move)
+                return search_move
+            gemini_move = tuple(gemini_move)
+            if cache is not None:
+                cache.store(state, gemini_move)
+        if gemini_move == tuple(search_move):
+            LLM_MOVES[source] += 1
+            return search_move
+
+        gemini_score = search.score_move(state, gemini_move, depth, start + args.time_limit * search.TIME_MARGIN, table)
+        if gemini_score is None or gemini_score < search_score - HYBRID_MAX_LOSS:
+            LLM_MOVES["outscored"] += 1
+            log_debug("Hybrid: Gemini move {} scores {} against {} for search move {}, playing search move",
+                      gemini_move, gemini_score, search_score, search_move)
+            return search_move
+        LLM_MOVES[source] += 1
+        log_debug("Hybrid: playing Gemini move {} (score {}, search {})", gemini_move, gemini_score, search_score)
+        return gemini_move
+
+    def close():
+        gemini.shutdown(wait=True, cancel_futures=True) # A running request gives up at its decision time
+        ask.close()
+        if cache is not None:
+            cache.close()
+
+    choose_move.close = close
+    return choose_move
+
+
+#* @brief Returns a function that picks each move with a search whose root moves are split across a pool of processes
+#*
+#* @param player_color color of our player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning our move
+def make_parallel_search_player(player_color, args):
+    # Imported here, as parallel_search and tablebase (through bitboard) import this module
+    import parallel_search
+    import tablebase
+
+    endgames = tablebase.Tablebase(args.tablebase_dir or tablebase.TABLE_DIR)
+    parallel = parallel_search.ParallelSearch(args.workers, endgames)
+    atexit.register(parallel.close) # In case the game ends without close_player, e.g. on an exception
+
+    def choose_move(state, opp_move):
+        move, score, depth = parallel.search(state, args.time_limit)
+        log_debug("Parallel search: depth {}, score {}", depth, score)
+        return move
+
+    choose_move.close = parallel.close
+    return choose_move
+
+
+#* @brief Wraps a player so that positions in the opening book are answered from the book without a search or LLM call
+#*
+#* @param choose_move function taking (state, opponent's last move) and returning our move
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning our move
+def add_opening_book(choose_move, args):
+    # Imported here, as opening_book (through bitboard and search) imports this module
+    import opening_book
+
+    book = opening_book.OpeningBook(args.book or opening_book.BOOK_PATH)
+    if not len(book):
+        log_debug("No opening book loaded")
+        return choose_move
+
+    def choose_book_move(state, opp_move):
+        known = book.probe(state)
+        if known is not None:
+            log_debug("Book move: {} (score {})", known[0], known[1])
+            return known[0]
+        return choose_move(state, opp_move)
+
+    choose_book_move.close = lambda: close_player(choose_move)
+    return choose_book_move
+
+
+#* @brief Releases what a player holds on to between moves (worker processes, background searches, LLM clients) once its game is over
+#*
+#* Players that need this have a close attribute; calling it for the others does nothing.
+#*
+#* @param choose_move function returned by a player factory
+#*
+#* @return void
+def close_player(choose_move):
+    close = getattr(choose_move, "close", None)
+    if close is not None:
+        close()
+
+
+# Ways our player can pick its moves, selected with --mode
+PLAYER_MODES = {
+    "gemini": make_gemini_player,
+    "search": make_search_player,
+    "parallel": make_parallel_search_player,
+    "hybrid": make_hybrid_player
+}
+
+
+#* @brief Adds the options of the Gemini and hybrid players to a command line parser
+#*
+#* @param parser argparse.ArgumentParser to add the options to
+#* @param backend LLM backend used when none is given
+#*
+#* @return void
+def add_llm_arguments(parser, backend="gemini"):
+    # Imported here, as the mock backend is only needed by the LLM players
+    import mock_llm
+
+    parser.add_argument("--hybrid-fraction", type=float, default=0.6,
+                        help="with --mode hybrid, share of the time limit to wait for Gemini while searching")
+    parser.add_argument("--prompt", choices=sorted(PROMPT_FORMATS), default="verbose",
+                        help="format of the rules and board updates sent to Gemini")
+    parser.add_argument("--json-answer", action="store_true",
+                        help="with --prompt indexed, have Gemini answer with JSON matching a schema (structured output)")
+    parser.add_argument("--llm-cache", help="file of the Gemini answer cache (default: llm_cache.sqlite next to this file)")
+    parser.add_argument("--llm-cache-ttl", type=float, default=30, help="days a cached Gemini answer is kept")
+    parser.add_argument("--no-llm-cache", action="store_true", help="always ask Gemini, without caching its answers")
+    parser.add_argument("--stateless", action="store_true",
+                        help="send every move to Gemini on its own with the rules as system instruction, instead of one growing chat")
+    parser.add_argument("--cache-rules", action="store_true",
+                        help="with --stateless, upload the rules once as cached content (needs rules long enough for the API to cache)")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream Gemini's answers and stop reading at the first legal move in parentheses")
+    parser.add_argument("--llm-backend", choices=["gemini", "mock"], default=backend,
+                        help="where LLM requests go: Gemini, or the offline stand-in from mock_llm.py")
+    parser.add_argument("--llm-record", metavar="FILE", help="append every prompt and answer to FILE, for replaying with --mock-replay")
+    parser.add_argument("--mock-replay", metavar="FILE", help="with --llm-backend mock, answer recorded prompts from FILE")
+    parser.add_argument("--mock-latency", type=float, default=mock_llm.MOCK_LATENCY, help="with --llm-backend mock, seconds a request takes")
+    parser.add_argument("--mock-jitter", type=float, default=mock_llm.MOCK_JITTER,
+                        help="with --llm-backend mock, most seconds a request takes more or less than --mock-latency")
+    parser.add_argument("--mock-rate-limit", type=float, default=0.0, help="with --llm-backend mock, chance of a request failing with 429")
+    parser.add_argument("--mock-malformed", type=float, default=0.0, help="with --llm-backend mock, chance of an answer not being a legal move")
+    parser.add_argument("--request-timeout", type=float, default=5.0, help="longest a single Gemini request may take, in seconds")
+    parser.add_argument("--max-attempts", type=int, default=4, help="most Gemini requests made for one move, counting retries")
+
+
+#* @brief Rejects combinations of the options added by add_llm_arguments that do not work together
+#*
+#* @param parser argparse.ArgumentParser the options were parsed with
+#* @param args parsed command line arguments
+#*
+#* @return void
+def check_llm_arguments(parser, args):
+    if args.json_answer and args.prompt != "indexed":
+        parser.error("--json-answer needs --prompt indexed")
+    if args.cache_rules and not args.stateless:
+        parser.error("--cache-rules needs --stateless")
+    if args.mock_replay and args.llm_backend != "mock":
+        parser.error("--mock-replay needs --llm-backend mock")
+
+
+#* @brief Reads the command line options given after the player file by the referee
+#*
+#* @return parsed command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Lasker Morris player")
+    parser.add_argument("--mode", choices=sorted(PLAYER_MODES), default="gemini", help="how moves are chosen")
+    parser.add_argument("--time-limit", type=float, default=2.0, help="seconds the referee allows per move")
+    parser.add_argument("--tablebase-dir", help="directory of the endgame tables from tablebase.py (default: tablebases/ next to this file)")
+    parser.add_argument("--ponder", action="store_true", help="with --mode search, search the opponent's likely replies during their turn")
+    parser.add_argument("--workers", type=int, help="worker processes for --mode parallel (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the mock LLM backend")
+    parser.add_argument("--book", help="opening book from opening_book.py (default: opening_book.bin next to this file)")
+    parser.add_argument("--no-book", action="store_true", help="do not play from the opening book")
+    add_llm_arguments(parser)
+    add_log_arguments(parser)
+    args = parser.parse_args()
+    check_llm_arguments(parser, args)
+    return args
+
+
 def main():
+    args = parse_args()
+    configure_logging(args)
+
     # Read initial color
     log_debug("OUR COLOR IS:")
     player_color = input().strip().lower()
-    log_debug("OUR COLOR IS: {}".format(player_color))
-
-    lasker_morris_instructions = make_lasker_morris_rules(player_color)
+    log_debug("OUR COLOR IS: {}", player_color)
 
-    secret_key = read_api_key()
+    choose_move = PLAYER_MODES[args.mode](player_color, args)
+    if not args.no_book:
+        choose_move = add_opening_book(choose_move, args)
 
-    client = genai.Client(api_key=secret_key)
-    chat = client.chats.create(model='gemini-2.0-flash')
-    try:
-        response = chat.send_message(lasker_morris_instructions)
-    except ClientError as e:
-        error_message = e.args[0]
-        if "429" in error_message:
-            error_code = 429
-            time.sleep(5)
-            response = chat.send_message(lasker_morris_instructions)
-
-    log_debug("FIRST GEMINI CONTACT: {} \n ----------------------------------- \n".format(response.text))
-    
     state = initial_state()
     state["turn"] = "blue" 
     
     # Blue makes the first move
     if player_color == "blue":
-        board_update = make_gemini_prompt(state, player_color, "none, this is the first move of the game")
-        try:
-            response = chat.send_message(board_update)
-        except ClientError as e:
-            error_message = e.args[0]
-            if "429" in error_message:
-                error_code = 429
-                time.sleep(5)
-                response = chat.send_message(board_update)
-        log_debug("Raw move: {}\n".format(response.text))
-        move = process_gemini_response(state, response.text)
-        log_debug("Processed move: {}\n".format(move))
+        move = choose_move(state, "none, this is the first move of the game")
+        log_debug("Processed move: {}\n", move)
         if move is None:
             sys.exit("No valid move found")
         state = apply_move(state, move)
@@ -437,18 +1326,8 @@ def main():
             if is_terminal(state):
                 break
 
-            board_update = make_gemini_prompt(state, player_color, opp_move)
-            try:
-                response = chat.send_message(board_update)
-            except ClientError as e:
-                error_message = e.args[0]
-                if "429" in error_message:
-                    error_code = 429
-                    time.sleep(5)
-                    response = chat.send_message(board_update)
-            log_debug("Raw move: {}\n".format(response.text))
-            move = process_gemini_response(state, response.text)
-            log_debug("Processed move: {}\n".format(move))
+            move = choose_move(state, opp_move)
+            log_debug("Processed move: {}\n", move)
             if move is None:
                 break
             state = apply_move(state, move)
@@ -460,5 +1339,7 @@ def main():
         except EOFError:
             break
 
+    close_player(choose_move)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,121 @@
+import os
+import time
+import sqlite3
+
+from bitboard import move_from_tuple, move_to_tuple
+from symmetry import canonicalize_state, position_key, transform_move, move_from_canonical
+
+# Persistent cache of Gemini's answers, so positions seen before (in this game or earlier ones, which is most
+# of the opening) are answered without a network round trip.
+#
+# Entries are keyed by the canonical position (see symmetry.py), the model and the prompt version, and hold the
+# move in the frame of the canonical position. Only moves that passed validation are stored. Entries older than
+# the time to live are dropped, and once the cache holds more than its maximum size the least recently used
+# entries are evicted.
+
+# File the cache is kept in
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite")
+
+# Days an answer is kept
+TTL_DAYS = 30
+
+# Most answers kept, the least recently used ones are evicted first
+MAX_ENTRIES = 100000
+
+# Stores between checks of the cache size
+EVICT_EVERY = 64
+
+
+class AnswerCache:
+    #* @brief Opens (or creates) the cache for a model and prompt version
+    #*
+    #* @param model name of the model the answers come from
+    #* @param prompt_version name and version of the prompt format the answers were given to
+    #* @param path file the cache is kept in
+    #* @param ttl_days days an answer is kept
+    #* @param max_entries most answers kept
+    def __init__(self, model, prompt_version, path=CACHE_PATH, ttl_days=TTL_DAYS, max_entries=MAX_ENTRIES):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl = ttl_days * 24 * 3600
+        self.max_entries = max_entries
+        self.stores = 0
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " position INTEGER, model TEXT, prompt TEXT, move INTEGER, created REAL, used REAL,"
+            " PRIMARY KEY (position, model, prompt))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS answers_used ON answers (used)")
+        self.evict()
+
+    #* @brief Looks up the answer stored for a game state
+    #*
+    #* @param state current state of the game
+    #*
+    #* @return move in the form (source, dest, removal), or None if there is no fresh answer for the position
+    def lookup(self, state):
+        position, symmetry = canonicalize_state(state)
+        key = (position_key(position), self.model, self.prompt_version)
+        row = self.db.execute("SELECT move, created FROM answers WHERE position = ? AND model = ? AND prompt = ?", key).fetchone()
+        if row is None:
+            return None
+        move, created = row
+        now = time.time()
+        if created < now - self.ttl:
+            self.db.execute("DELETE FROM answers WHERE position = ? AND model = ? AND prompt = ?", key)
+            return None
+        self.db.execute("UPDATE answers SET used = ? WHERE position = ? AND model = ? AND prompt = ?", (now,) + key)
+        return move_to_tuple(move_from_canonical(move, symmetry), position[5])
+
+    #* @brief Stores a validated answer for a game state
+    #*
+    #* @param state current state of the game
+    #* @param move legal move in the form (source, dest, removal)
+    #*
+    #* @return void
+    def store(self, state, move):
+        position, symmetry = canonicalize_state(state)
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+            (position_key(position), self.model, self.prompt_version, transform_move(move_from_tuple(move), symmetry), now, now)
+        )
+        self.stores += 1
+        if self.stores % EVICT_EVERY == 0:
+            self.evict()
+
+    #* @brief Drops expired answers and the least recently used ones above the maximum size
+    #*
+    #* @return void
+    def evict(self):
+        self.db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+        count = self.db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM answers WHERE used <= (SELECT used FROM answers ORDER BY used DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    #* @brief Closes the cache file
+    #*
+    #* @return void
+    def close(self):
+        self.db.close()
+
+
+#* @brief Opens the cache, or gives up on caching if the file cannot be used
+#*
+#* @param model name of the model the answers come from
+#* @param prompt_version name and version of the prompt format the answers were given to
+#* @param path file the cache is kept in
+#* @param ttl_days days an answer is kept
+#*
+#* @return AnswerCache, or None if the file could not be opened
+def open_cache(model, prompt_version, path=CACHE_PATH, ttl_days=TTL_DAYS):
+    try:
+        return AnswerCache(model, prompt_version, path, ttl_days)
+    except sqlite3.Error:
+        return None
@@ -0,0 +1,288 @@
+import time
+import random
+import asyncio
+import contextlib
+
+try:
+    from google import genai
+    from google.genai import types
+except ImportError:
+    genai = types = None # Only the mock backend (mock_llm.py) can be used without google-genai
+
+# Client layer for the Gemini API used by the LLM player.
+#
+# Two kinds of session are offered: a Chat, which keeps the conversation history and resends it with every
+# message, and a StatelessSession, which holds the rules as a system instruction (or as cached content on the
+# server) and sends each message on its own, so requests stay the same size for the whole game.
+#
+# Every request gets a per-request timeout and is retried on rate limits (429), server errors and timeouts
+# with jittered exponential backoff, but never past the deadline of the move it is for: a request that
+# cannot be answered in time raises LLMError so the player can fall back to another move while the referee
+# is still waiting. Requests are made with the asyncio interface of the SDK on one event loop kept for the
+# life of the client, so its HTTP connections are pooled between moves; send() wraps it for synchronous code.
+#
+# The backend the requests go to is pluggable: anything with the async interface of genai.Client that is used
+# here (aio.chats.create, aio.models.generate_content(_stream) and aio.caches.create) can be passed in, like
+# the offline stand-in in mock_llm.py. Configs are SDK objects when google-genai is installed and plain
+# dictionaries otherwise, and errors are retried by their HTTP status code.
+
+# Model used when none is given
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Longest a single request may take, in seconds (less when the deadline is closer)
+REQUEST_TIMEOUT = 5.0
+
+# Most requests made for one message, counting the first one
+MAX_ATTEMPTS = 4
+
+# Backoff before retry n is a random time up to min(MAX_BACKOFF, BACKOFF_BASE * 2 ** n) seconds
+BACKOFF_BASE = 0.25
+MAX_BACKOFF = 4.0
+
+# A request is not started with less than this many seconds left before the deadline
+MIN_REQUEST_TIME = 0.2
+
+# HTTP status codes worth retrying: timeouts, rate limits and server errors
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+# How long rules uploaded as cached content are kept on the server
+CACHED_CONTENT_TTL = "3600s"
+
+
+class LLMError(Exception):
+    # Raised when a request fails for good or cannot be answered before its deadline
+    pass
+
+
+#* @brief Checks if a failed request is worth retrying
+#*
+#* @param error exception raised by the request
+#*
+#* @return boolean value indicating if the request may succeed when retried
+def is_retryable(error):
+    code = getattr(error, "code", None) # Set on the SDK's APIError and on the mock backend's errors
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+#* @brief Builds the config sent with a request
+#*
+#* @param schema JSON schema the answer must follow (structured output), None for a free text answer
+#* @param options other GenerateContentConfig fields, e.g. system_instruction
+#*
+#* @return GenerateContentConfig, or None when everything is left at the defaults
+def make_config(schema=None, **options):
+    if schema is not None:
+        options.update(response_mime_type="application/json", response_schema=schema)
+    if not options:
+        return None
+    if types is None:
+        return options
+    return types.GenerateContentConfig(**options)
+
+
+#* @brief Reads a streamed answer until it ends or the caller has seen enough
+#*
+#* @param open_stream coroutine returning the async iterator of response chunks
+#* @param on_text function called with the text of each chunk, returning True to stop reading
+#*
+#* @return the text read
+async def read_stream(open_stream, on_text):
+    text = ""
+    stream = await open_stream
+    # Leaving the loop early does not close an async generator, aclosing does so before we return: the
+    # connection is dropped then and the rest of the answer is never downloaded
+    async with contextlib.aclosing(stream):
+        async for chunk in stream:
+            chunk_text = chunk.text or ""
+            text += chunk_text
+            if on_text(chunk_text):
+                break
+    return text
+
+
+class GeminiClient:
+    #* @brief Creates the Gemini client and the event loop its requests run on
+    #*
+    #* @param api_key Gemini API key
+    #* @param model model to ask
+    #* @param request_timeout longest a single request may take, in seconds
+    #* @param max_attempts most requests made for one message
+    #* @param seed seed of the backoff jitter, None for an unseeded one
+    #* @param backend object with the async interface of genai.Client to send the requests to, None for Gemini itself
+    def __init__(self, api_key, model=DEFAULT_MODEL, request_timeout=REQUEST_TIMEOUT, max_attempts=MAX_ATTEMPTS, seed=None, backend=None):
+        if backend is None:
+            if genai is None:
+                raise LLMError("google-genai is not installed")
+            backend = genai.Client(api_key=api_key)
+        self.client = backend
+        self.model = model
+        self.request_timeout = request_timeout
+        self.max_attempts = max_attempts
+        self.random = random.Random(seed)
+        self.loop = asyncio.new_event_loop()
+        self.attempts = 0 # requests made for the last message
+
+    #* @brief Makes a request, retrying it with backoff until it succeeds, fails for good or runs out of time
+    #*
+    #* @param make_request function returning a new awaitable of the request each time it is called
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #*
+    #* @return the result of the request
+    async def request(self, make_request, deadline=None):
+        self.attempts = 0
+        while True:
+            timeout = self.request_timeout
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining < MIN_REQUEST_TIME:
+                    raise LLMError("no time left for a request after {} attempts".format(self.attempts))
+                timeout = min(timeout, remaining)
+
+            self.attempts += 1
+            try:
+                return await asyncio.wait_for(make_request(), timeout)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise LLMError("request failed: {!r}".format(e)) from e
+                if self.attempts >= self.max_attempts:
+                    raise LLMError("request failed after {} attempts: {!r}".format(self.attempts, e)) from e
+                error = e
+
+            delay = self.random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * 2 ** self.attempts))
+            if deadline is not None and time.time() + delay + MIN_REQUEST_TIME > deadline:
+                raise LLMError("no time left to retry after {!r}".format(error)) from error
+            await asyncio.sleep(delay)
+
+    #* @brief Runs a coroutine on the client's event loop, for callers that are not async
+    #*
+    #* @param coroutine coroutine to run
+    #*
+    #* @return the result of the coroutine
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    #* @brief Starts a chat session, which keeps the conversation history between messages
+    #*
+    #* @return Chat object
+    def start_chat(self):
+        return Chat(self, self.client.aio.chats.create(model=self.model))
+
+    #* @brief Starts a stateless session, where every message is sent on its own after the given rules
+    #*
+    #* @param rules text sent as the system instruction of every request
+    #* @param cache_rules upload the rules once as cached content and refer to it instead of resending them
+    #*        (falls back to the system instruction if the server refuses, e.g. when the rules are too short)
+    #* @param deadline time.time() value uploading the rules must finish by, None for no deadline
+    #*
+    #* @return StatelessSession object
+    def start_stateless(self, rules, cache_rules=False, deadline=None):
+        if cache_rules:
+            config = {"system_instruction": rules, "ttl": CACHED_CONTENT_TTL}
+            if types is not None:
+                config = types.CreateCachedContentConfig(**config)
+            try:
+                cached = self.run(self.request(lambda: self.client.aio.caches.create(model=self.model, config=config), deadline))
+                return StatelessSession(self, {"cached_content": cached.name})
+            except LLMError:
+                pass
+        return StatelessSession(self, {"system_instruction": rules})
+
+    #* @brief Closes the event loop
+    #*
+    #* @return void
+    def close(self):
+        self.loop.close()
+
+
+class Chat:
+    #* @brief Wraps a chat session of the SDK so its messages go through the client's retry logic
+    #*
+    #* @param client GeminiClient the chat belongs to
+    #* @param session async chat session from the SDK
+    def __init__(self, client, session):
+        self.client = client
+        self.session = session
+
+    #* @brief Sends a message
+    #*
+    #* @param message text to send
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #* @param schema JSON schema the answer must follow, None for a free text answer
+    #*
+    #* @return the SDK response (its text is in response.text)
+    async def send_async(self, message, deadline=None, schema=None):
+        config = make_config(schema)
+        return await self.client.request(lambda: self.session.send_message(message, config=config), deadline)
+
+    #* @brief Sends a message and waits for the answer
+    #*
+    #* @param message text to send
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #* @param schema JSON schema the answer must follow, None for a free text answer
+    #*
+    #* @return the SDK response (its text is in response.text)
+    def send(self, message, deadline=None, schema=None):
+        return self.client.run(self.send_async(message, deadline, schema))
+
+    #* @brief Sends a message and streams the answer, stopping as soon as on_text asks to
+    #*
+    #* The chat only records the answer in its history when the stream is read to the end.
+    #*
+    #* @param message text to send
+    #* @param on_text function called with the text of each chunk, returning True to stop reading
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #* @param schema JSON schema the answer must follow, None for a free text answer
+    #*
+    #* @return the text read
+    def stream(self, message, on_text, deadline=None, schema=None):
+        config = make_config(schema)
+        return self.client.run(self.client.request(
+            lambda: read_stream(self.session.send_message_stream(message, config=config), on_text), deadline))
+
+
+class StatelessSession:
+    #* @brief Sends messages one at a time, each with the rules but without the earlier messages
+    #*
+    #* @param client GeminiClient the session belongs to
+    #* @param options GenerateContentConfig fields carrying the rules (system_instruction or cached_content)
+    def __init__(self, client, options):
+        self.client = client
+        self.options = options
+
+    #* @brief Sends a message
+    #*
+    #* @param message text to send
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #* @param schema JSON schema the answer must follow, None for a free text answer
+    #*
+    #* @return the SDK response (its text is in response.text)
+    async def send_async(self, message, deadline=None, schema=None):
+        config = make_config(schema, **self.options)
+        models = self.client.client.aio.models
+        return await self.client.request(lambda: models.generate_content(model=self.client.model, contents=message, config=config), deadline)
+
+    #* @brief Sends a message and waits for the answer
+    #*
+    #* @param message text to send
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #* @param schema JSON schema the answer must follow, None for a free text answer
+    #*
+    #* @return the SDK response (its text is in response.text)
+    def send(self, message, deadline=None, schema=None):
+        return self.client.run(self.send_async(message, deadline, schema))
+
+    #* @brief Sends a message and streams the answer, stopping as soon as on_text asks to
+    #*
+    #* @param message text to send
+    #* @param on_text function called with the text of each chunk, returning True to stop reading
+    #* @param deadline time.time() value the answer is needed by, None for no deadline
+    #* @param schema JSON schema the answer must follow, None for a free text answer
+    #*
+    #* @return the text read
+    def stream(self, message, on_text, deadline=None, schema=None):
+        config = make_config(schema, **self.options)
+        models = self.client.client.aio.models
+        return self.client.run(self.client.request(
+            lambda: read_stream(models.generate_content_stream(model=self.client.model, contents=message, config=config), on_text), deadline))
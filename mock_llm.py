@@ -0,0 +1,372 @@
+import re
+import json
+import random
+import asyncio
+import collections
+
+# Offline stand-in for the Gemini API, so the LLM players can be run, timed and played in tournaments without
+# a network or an API key (python jd_gemini_new.py --llm-backend mock).
+#
+# MockBackend has the same shape as the async interface of the google-genai client that llm_client.py uses
+# (aio.chats, aio.models and aio.caches), so the whole client layer, retries and timeouts included, runs
+# unchanged on top of it. Answers are replayed from a recording made with --llm-record when the prompt was
+# recorded, and otherwise synthesised by picking a random legal move from the prompt, in the answer format
+# the prompt asks for. Every request waits a configurable latency and can be made to fail with a rate
+# limit (429) or to come back malformed, all from a seeded random generator so runs are reproducible.
+
+# Model name the mock answers under, so they are never mixed with real answers in the answer cache
+MOCK_MODEL = "mock"
+
+# Seconds a request takes by default, give or take MOCK_JITTER
+MOCK_LATENCY = 0.2
+MOCK_JITTER = 0.1
+
+# Characters per chunk of a streamed answer, and the seconds between chunks
+STREAM_CHUNK_SIZE = 8
+STREAM_CHUNK_DELAY = 0.01
+
+# Answers given instead of a move when a malformed output is injected
+MALFORMED_ANSWERS = [
+    "I think the best move is to place a piece in the centre of the board.",
+    "(h1 d4 r0)",
+    "(z9 z9 r0)",
+    "Move: a1-a4",
+    '{"index": "first"}',
+    ""
+]
+
+# Counts of the requests made and faults injected in this process, read by tournament.py
+STATS = collections.Counter()
+
+# Our color, as written in the rules of every prompt format
+RULES_COLOR = re.compile(r"(?:our player color is|You are) (blue|orange)")
+
+# Parts of the prompt formats the legal moves are read from
+INDEXED_MOVE = re.compile(r"^(\d+): ", re.MULTILINE)
+COMPACT_MOVES = re.compile(r"^Legal: (.*)$", re.MULTILINE)
+VERBOSE_HANDS = re.compile(r"Our player has (\d+) pieces in hand .* The opponent has (\d+) pieces in hand")
+VERBOSE_SPACE = re.compile(r"Space: (\w\d) Current piece there: (\w+)")
+
+
+class MockAPIError(Exception):
+    # Raised for an injected failure, with the HTTP status code in code like the SDK's APIError
+    def __init__(self, code, message):
+        super().__init__("{} {}".format(code, message))
+        self.code = code
+
+
+class MockResponse:
+    #* @brief Holds an answer the way the SDK's response does
+    #*
+    #* @param text text of the answer
+    #* @param prompt text of the request, used to estimate the token counts
+    def __init__(self, text, prompt=""):
+        self.text = text
+        self.usage_metadata = MockUsage(len(prompt) // 4, len(text) // 4)
+
+
+class MockUsage:
+    #* @brief Holds estimated token counts the way the SDK's usage metadata does
+    #*
+    #* @param prompt_tokens tokens in the request
+    #* @param answer_tokens tokens in the answer
+    def __init__(self, prompt_tokens, answer_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = answer_tokens
+        self.total_token_count = prompt_tokens + answer_tokens
+
+
+#* @brief Reads a field of a request config, which may be an SDK config object, a dictionary or None
+#*
+#* @param config config passed with the request
+#* @param name name of the field
+#*
+#* @return value of the field, or None if it is not set
+def config_value(config, name):
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get(name)
+    return getattr(config, name, None)
+
+
+#* @brief Reads the game state back from the board update of the verbose prompt format
+#*
+#* @param prompt text of the board update
+#* @param color our color
+#*
+#* @return state with our color to move, or None if the prompt is not in the verbose format
+def state_from_verbose_prompt(prompt, color):
+    from jd_gemini_new import initial_state, compute_hash
+
+    hands = VERBOSE_HANDS.search(prompt)
+    if hands is None:
+        return None
+    opponent = "orange" if color == "blue" else "blue"
+    state = initial_state()
+    state["turn"] = color
+    state["hand"] = {color: int(hands.group(1)), opponent: int(hands.group(2))}
+    for pos, occ in VERBOSE_SPACE.findall(prompt):
+        if occ in state["pieces"]:
+            state["board"][pos] = occ
+            state["pieces"][occ] += 1
+    state["hash"] = compute_hash(state)
+    return state
+
+
+#* @brief Lists the legal moves offered in a prompt
+#*
+#* @param prompt text of the board update
+#* @param color our color, or None if the rules did not say
+#*
+#* @return (list of move strings, boolean value indicating if the prompt wants the number of the move), or
+#*         (None, False) if no moves could be read from the prompt
+def legal_moves_in_prompt(prompt, color):
+    from jd_gemini_new import generate_moves, move_to_string
+
+    numbers = INDEXED_MOVE.findall(prompt)
+    if numbers:
+        return numbers, True
+    compact = COMPACT_MOVES.search(prompt)
+    if compact is not None:
+        return compact.group(1).split(" | "), False
+    if color is not None:
+        state = state_from_verbose_prompt(prompt, color)
+        if state is not None:
+            return [move_to_string(move, color) for move in generate_moves(state, color)], False
+    return None, False
+
+
+#* @brief Loads the answers recorded with --llm-record
+#*
+#* @param path JSON lines file of {"prompt": ..., "answer": ...} records
+#*
+#* @return dictionary of prompt -> list of recorded answers, in the order they were given
+def load_recording(path):
+    recording = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recording.setdefault(entry["prompt"], []).append(entry["answer"])
+    return recording
+
+
+#* @brief Appends an answer to a recording, for replaying it later with the mock backend
+#*
+#* @param path JSON lines file to append to
+#* @param prompt text sent to the model
+#* @param answer text of its answer
+#*
+#* @return void
+def record_answer(path, prompt, answer):
+    with open(path, "a") as f:
+        f.write(json.dumps({"prompt": prompt, "answer": answer}) + "\n")
+
+
+class MockBackend:
+    #* @brief Creates the stand-in for the google-genai client
+    #*
+    #* @param latency seconds a request takes on average
+    #* @param jitter most seconds a request takes more or less than the average
+    #* @param rate_limit chance of a request failing with a rate limit (429)
+    #* @param malformed chance of an answer being something other than a legal move
+    #* @param recording dictionary of prompt -> recorded answers from load_recording, or None
+    #* @param seed seed of the latencies, faults and synthesised moves
+    def __init__(self, latency=MOCK_LATENCY, jitter=MOCK_JITTER, rate_limit=0.0, malformed=0.0, recording=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.malformed = malformed
+        self.recording = recording or {}
+        self.replayed = collections.Counter() # recorded answers used so far, per prompt
+        self.random = random.Random(seed)
+        self.cached_rules = {}
+        self.aio = self # llm_client only uses the async interface
+        self.chats = MockChats(self)
+        self.models = MockModels(self)
+        self.caches = MockCaches(self)
+
+    #* @brief Waits for the latency of a request and injects a rate limit when one is due
+    #*
+    #* @return void
+    async def wait(self):
+        STATS["requests"] += 1
+        await asyncio.sleep(max(0.0, self.random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+        if self.random.random() < self.rate_limit:
+            STATS["rate_limited"] += 1
+            raise MockAPIError(429, "RESOURCE_EXHAUSTED")
+
+    #* @brief Answers a prompt, from the recording if it was recorded, otherwise with a random legal move
+    #*
+    #* @param prompt text of the request
+    #* @param rules rules the prompt was sent with (system instruction or earlier chat messages), used to find our color
+    #* @param config config of the request
+    #*
+    #* @return text of the answer
+    def answer(self, prompt, rules, config):
+        if self.random.random() < self.malformed:
+            STATS["malformed"] += 1
+            return self.random.choice(MALFORMED_ANSWERS)
+        answers = self.recording.get(prompt)
+        if answers:
+            STATS["replayed"] += 1
+            text = answers[self.replayed[prompt] % len(answers)]
+            self.replayed[prompt] += 1
+            return text
+
+        color = RULES_COLOR.search(rules + prompt)
+        moves, indexed = legal_moves_in_prompt(prompt, color.group(1) if color else None)
+        if not moves:
+            return "Understood." # The rules, sent on their own before the first move
+        STATS["synthesised"] += 1
+        move = self.random.choice(moves)
+        if not indexed:
+            return "({})".format(move)
+        if config_value(config, "response_schema") is not None:
+            return json.dumps({"index": int(move)})
+        return move
+
+    #* @brief Answers a request in one piece
+    #*
+    #* @param prompt text of the request
+    #* @param rules rules the prompt was sent with
+    #* @param config config of the request
+    #*
+    #* @return MockResponse
+    async def respond(self, prompt, rules, config):
+        await self.wait()
+        return MockResponse(self.answer(prompt, rules, config), prompt)
+
+    #* @brief Answers a request as a stream of chunks
+    #*
+    #* @param prompt text of the request
+    #* @param rules rules the prompt was sent with
+    #* @param config config of the request
+    #*
+    #* @return async iterator of MockResponse chunks
+    async def respond_stream(self, prompt, rules, config):
+        await self.wait()
+        text = self.answer(prompt, rules, config) + " This move keeps our pieces flexible for the next turns."
+
+        async def chunks():
+            for i in range(0, len(text), STREAM_CHUNK_SIZE):
+                if i:
+                    await asyncio.sleep(STREAM_CHUNK_DELAY)
+                yield MockResponse(text[i:i + STREAM_CHUNK_SIZE])
+
+        return chunks()
+
+
+class MockChats:
+    #* @brief Stands in for client.aio.chats
+    #*
+    #* @param backend MockBackend the chats belong to
+    def __init__(self, backend):
+        self.backend = backend
+
+    #* @brief Starts a chat
+    #*
+    #* @param model name of the model (ignored)
+    #*
+    #* @return MockChat object
+    def create(self, model):
+        return MockChat(self.backend)
+
+
+class MockChat:
+    #* @brief Stands in for an async chat session, which remembers the messages sent to it
+    #*
+    #* @param backend MockBackend answering the chat
+    def __init__(self, backend):
+        self.backend = backend
+        self.history = ""
+
+    #* @brief Sends a message
+    #*
+    #* @param message text to send
+    #* @param config config of the request
+    #*
+    #* @return MockResponse
+    async def send_message(self, message, config=None):
+        response = await self.backend.respond(message, self.history, config)
+        self.history += message + "\n"
+        return response
+
+    #* @brief Sends a message and streams the answer
+    #*
+    #* @param message text to send
+    #* @param config config of the request
+    #*
+    #* @return async iterator of MockResponse chunks
+    async def send_message_stream(self, message, config=None):
+        stream = await self.backend.respond_stream(message, self.history, config)
+        self.history += message + "\n"
+        return stream
+
+
+class MockModels:
+    #* @brief Stands in for client.aio.models, where each request carries its rules in its config
+    #*
+    #* @param backend MockBackend answering the requests
+    def __init__(self, backend):
+        self.backend = backend
+
+    #* @brief Finds the rules a request was sent with
+    #*
+    #* @param config config of the request
+    #*
+    #* @return text of the rules, empty if there are none
+    def rules(self, config):
+        cached = config_value(config, "cached_content")
+        if cached is not None:
+            return self.backend.cached_rules.get(cached, "")
+        return config_value(config, "system_instruction") or ""
+
+    #* @brief Sends a request
+    #*
+    #* @param model name of the model (ignored)
+    #* @param contents text to send
+    #* @param config config of the request
+    #*
+    #* @return MockResponse
+    async def generate_content(self, model, contents, config=None):
+        return await self.backend.respond(contents, self.rules(config), config)
+
+    #* @brief Sends a request and streams the answer
+    #*
+    #* @param model name of the model (ignored)
+    #* @param contents text to send
+    #* @param config config of the request
+    #*
+    #* @return async iterator of MockResponse chunks
+    async def generate_content_stream(self, model, contents, config=None):
+        return await self.backend.respond_stream(contents, self.rules(config), config)
+
+
+class MockCaches:
+    #* @brief Stands in for client.aio.caches
+    #*
+    #* @param backend MockBackend the cached content is kept in
+    def __init__(self, backend):
+        self.backend = backend
+
+    #* @brief Stores rules as cached content
+    #*
+    #* @param model name of the model (ignored)
+    #* @param config config holding the system instruction to cache
+    #*
+    #* @return object whose name refers to the cached content
+    async def create(self, model, config):
+        await self.backend.wait()
+        name = "cachedContents/mock-{}".format(len(self.backend.cached_rules))
+        self.backend.cached_rules[name] = config_value(config, "system_instruction") or ""
+        return MockCachedContent(name)
+
+
+class MockCachedContent:
+    #* @brief Holds the name of cached content the way the SDK's CachedContent does
+    #*
+    #* @param name name of the cached content
+    def __init__(self, name):
+        self.name = name
@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import struct
+import argparse
+
+from bitboard import BLUE, generate_moves, apply_move, to_state, from_state, move_from_tuple, move_to_tuple
+from symmetry import canonical_position, position_key, move_from_canonical
+from search import Searcher, TranspositionTable
+
+# Opening book for the placement phase.
+#
+# The book maps the canonical form (see symmetry.py) of every position in the first few plies of the game to
+# the best move found for it by a deep fixed-depth search, so those moves are answered with a dictionary
+# lookup instead of a search or a Gemini round trip. Moves are stored in the frame of the canonical position
+# and mapped back onto the real position with the symmetry found when it is canonicalised.
+#
+# File format (little endian): a header of the magic bytes, the format version and the number of entries,
+# then one record per position, sorted by key:
+#
+#     key    8 bytes  symmetry.position_key of the canonical position
+#     move   2 bytes  move code (see bitboard.encode_move) in the canonical frame
+#     score  4 bytes  search score of the move for the player to move
+
+BOOK_MAGIC = b"LMOB"
+BOOK_VERSION = 1
+HEADER_FORMAT = struct.Struct("<4sHI")
+RECORD_FORMAT = struct.Struct("<QHi")
+
+# File the book is written to and read from
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# Plies covered by the book when the builder is run without --plies (every reply is covered, not just ours)
+DEFAULT_PLIES = 4
+
+# Search depth used for every book position when the builder is run without --depth
+DEFAULT_DEPTH = 7
+
+
+#* @brief Returns the position at the start of the game, blue to move
+#*
+#* @return position tuple
+def start_position():
+    return (0, 0, 10, 10, 0, BLUE)
+
+
+class OpeningBookBuilder:
+    #* @brief Sets up a builder that searches every book position to a fixed depth
+    #*
+    #* @param depth search depth for every position
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self.table = TranspositionTable() # Shared between positions, neighbouring book positions transpose a lot
+        self.entries = {} # position key -> (move code in the canonical frame, score)
+
+    #* @brief Searches a canonical position for its best move
+    #*
+    #* @param position canonical position tuple
+    #*
+    #* @return (move code, score) for the player to move, or None if there is no legal move
+    def search(self, position):
+        searcher = Searcher(float("inf"), self.depth, self.table)
+        move, score, depth = searcher.iterative_deepening(to_state(position))
+        if move is None:
+            return None
+        return move_from_tuple(move), score
+
+    #* @brief Searches every canonical position reachable in the given number of plies
+    #*
+    #* Positions are expanded one ply at a time, so symmetric positions reached by different move orders are
+    #* only searched once. Positions where both hands are empty are past the placement phase and left out.
+    #*
+    #* @param plies number of plies from the start of the game to cover
+    #* @param progress function called with (ply, positions done, positions at this ply) as positions are searched, or None
+    #*
+    #* @return void
+    def build(self, plies=DEFAULT_PLIES, progress=None):
+        position, symmetry = canonical_position(start_position())
+        frontier = {position_key(position): position}
+        for ply in range(plies):
+            children = {}
+            for done, (key, position) in enumerate(frontier.items(), 1):
+                if key not in self.entries:
+                    entry = self.search(position)
+                    if entry is None:
+                        continue
+                    self.entries[key] = entry
+                if ply + 1 < plies:
+                    for move in generate_moves(position):
+                        child, symmetry = canonical_position(apply_move(position, move))
+                        if child[2] or child[3]:
+                            children.setdefault(position_key(child), child)
+                if progress is not None:
+                    progress(ply, done, len(frontier))
+            frontier = children
+
+    #* @brief Writes the book to a file
+    #*
+    #* @param path file to write
+    #*
+    #* @return void
+    def write(self, path=BOOK_PATH):
+        with open(path, "wb") as f:
+            f.write(HEADER_FORMAT.pack(BOOK_MAGIC, BOOK_VERSION, len(self.entries)))
+            for key in sorted(self.entries):
+                move, score = self.entries[key]
+                f.write(RECORD_FORMAT.pack(key, move, score))
+
+
+class OpeningBook:
+    #* @brief Loads the book from a file, the book is empty if the file is missing or not a book
+    #*
+    #* @param path file written by OpeningBookBuilder
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        self.entries = {} # position key -> (move code in the canonical frame, score)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) >= HEADER_FORMAT.size:
+                magic, version, count = HEADER_FORMAT.unpack_from(data)
+                if magic == BOOK_MAGIC and version == BOOK_VERSION and len(data) == HEADER_FORMAT.size + count * RECORD_FORMAT.size:
+                    for key, move, score in RECORD_FORMAT.iter_unpack(data[HEADER_FORMAT.size:]):
+                        self.entries[key] = (move, score)
+
+    def __len__(self):
+        return len(self.entries)
+
+    #* @brief Looks up the book move for a game state
+    #*
+    #* @param state current state of the game
+    #*
+    #* @return (move in the form (source, dest, removal), score), or None if the position is not in the book
+    def probe(self, state):
+        if not self.entries:
+            return None
+        position, symmetry = canonical_position(from_state(state))
+        entry = self.entries.get(position_key(position))
+        if entry is None:
+            return None
+        move, score = entry
+        return move_to_tuple(move_from_canonical(move, symmetry), position[5]), score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Lasker Morris opening book by searching the placement phase")
+    parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="plies from the start of the game to cover")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="search depth for every book position")
+    parser.add_argument("--out", default=BOOK_PATH, help="file to write the book to")
+    args = parser.parse_args()
+
+    if args.plies < 1 or args.plies > 20:
+        sys.exit("The placement phase is 20 plies long: --plies must be between 1 and 20")
+
+    start = time.time()
+
+    def progress(ply, done, total):
+        print("\rply {}: {}/{} positions, {:.0f}s".format(ply, done, total, time.time() - start),
+              end="\n" if done == total else "", file=sys.stderr, flush=True)
+
+    builder = OpeningBookBuilder(args.depth)
+    builder.build(args.plies, progress)
+    builder.write(args.out)
+    print("{} positions written to {}".format(len(builder.entries), args.out), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from jd_gemini_new import copy_state, generate_ordered_moves
+from search import TIME_LIMIT, TIME_MARGIN, WIN_SCORE, Searcher, TranspositionTable
+
+# Root-split search: the legal moves at the root are dealt out to a pool of worker processes, each worker
+# runs the usual iterative-deepening search over its share of the moves until the deadline, and the results
+# of the deepest iteration every worker completed are compared to pick the move. Workers keep their own
+# transposition table between moves.
+#
+# The search uses no randomness. Limited by max_depth, it is deterministic for a given number of workers, and
+# with one worker it plays the same moves as search.iterative_deepening. Limited by the clock, how deep each
+# worker gets before the deadline depends on the machine and its load, so timed searches are not reproducible.
+
+# Seconds kept back from the workers' deadline to collect and compare their results
+COLLECT_TIME = 0.05
+
+# Transposition table of the worker process, created when the worker starts
+_worker_table = None
+
+
+#* @brief Sets up a worker process
+#*
+#* @return void
+def _start_worker():
+    global _worker_table
+    _worker_table = TranspositionTable()
+
+
+#* @brief Does nothing, used to get the worker processes started before the first move
+#*
+#* @return the worker's process id
+def _warm_up(_):
+    return os.getpid()
+
+
+#* @brief Searches a share of the root moves in a worker process
+#*
+#* @param state current state of the game
+#* @param moves root moves given to this worker, best guess first
+#* @param deadline time.time() value at which the search must stop
+#* @param max_depth deepest iteration to run, None for no limit
+#*
+#* @return ((depth, score, move) of every completed depth, whether deeper iterations would not change the result)
+def _search_share(state, moves, deadline, max_depth):
+    searcher = Searcher(deadline, max_depth, _worker_table)
+    searcher.iterative_deepening(state, moves)
+    iterations = searcher.iterations
+    finished = False
+    if iterations:
+        depth, score = iterations[-1][:2]
+        finished = depth == max_depth or abs(score) >= WIN_SCORE - depth
+    return iterations, finished
+
+
+class ParallelSearch:
+    #* @brief Starts the pool of worker processes
+    #*
+    #* @param workers number of worker processes (the number of cores if None)
+    #* @param tablebase endgame tablebase to play from when it covers the position, or None
+    def __init__(self, workers=None, tablebase=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.tablebase = tablebase
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_start_worker)
+        list(self.pool.map(_warm_up, range(self.workers)))
+
+    #* @brief Finds the best move for the player to move, splitting the root moves across the workers
+    #*
+    #* @param state current state of the game
+    #* @param time_limit seconds the referee allows for this move, None to search to max_depth without a deadline
+    #* @param max_depth deepest iteration to run, None for no limit
+    #*
+    #* @return the best move found, the value of it and the depth it was found at
+    def search(self, state, time_limit=TIME_LIMIT, max_depth=None):
+        start = time.time()
+        if self.tablebase is not None:
+            known = self.tablebase.best_move(state)
+            if known is not None:
+                move, result = known
+                return move, result * (WIN_SCORE - 1000), 0
+
+        moves = list(generate_ordered_moves(copy_state(state), state["turn"]))
+        if len(moves) < 2:
+            return (moves[0] if moves else None), 0, 0
+
+        if time_limit is None:
+            deadline = float("inf")
+            timeout = None
+        else:
+            deadline = start + time_limit * TIME_MARGIN - COLLECT_TIME
+            timeout = max(0, start + time_limit * TIME_MARGIN - time.time())
+
+        # Deal the moves out in order so every worker gets some of the most promising ones
+        shares = [moves[i::self.workers] for i in range(min(self.workers, len(moves)))]
+        futures = [self.pool.submit(_search_share, state, share, deadline, max_depth) for share in shares]
+        done, late = wait(futures, timeout=timeout)
+        for future in late:
+            future.cancel() # Its moves are left out, the worker stops by itself at the deadline
+        results = [future.result() for future in futures if future in done]
+        if not results:
+            return moves[0], 0, 0
+
+        # Compare the deepest iteration every worker completed; a finished worker's result holds at any depth
+        unfinished = [len(iterations) for iterations, finished in results if not finished]
+        depth = min(unfinished) if unfinished else max(len(iterations) for iterations, finished in results)
+        if depth == 0:
+            return moves[0], 0, 0
+        best = None
+        for iterations, finished in results:
+            if not iterations:
+                continue
+            iteration_depth, score, move = iterations[min(depth, len(iterations)) - 1]
+            # Ties go to the move that was ordered first, so the result does not depend on the number of workers
+            rank = (score, -moves.index(move))
+            if best is None or rank > best[0]:
+                best = (rank, move)
+        return best[1], best[0][0], depth
+
+    #* @brief Stops the worker processes and waits for them to exit
+    #*
+    #* @return void
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import bitboard
+from jd_gemini_new import (
+    initial_state, generate_moves, apply_move, is_terminal, parse_move, move_to_string
+)
+
+# Perft: counts the positions reached after exactly a given number of plies, by generating and applying every
+# legal move. The counts only depend on the rules, so any change to the move generator (or a different engine,
+# like bitboard.py) must give the same numbers; the time taken doubles as a benchmark of the raw generator.
+#
+# Games stop at terminal positions (see is_terminal), so a position where the game is over has no children.
+#
+# Reference counts are kept in perft_reference.json and checked with:
+#
+#     python perft.py --verify
+
+# File holding the reference positions (as move lists from the start of the game) and their counts
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perft_reference.json")
+
+
+#* @brief Counts the positions reached after a number of plies, using the dictionary rules
+#*
+#* @param state current state of the game
+#* @param depth number of plies
+#*
+#* @return number of leaf positions
+def perft(state, depth):
+    if depth == 0:
+        return 1
+    if is_terminal(state):
+        return 0
+    moves = generate_moves(state, state["turn"])
+    if depth == 1:
+        return len(moves)
+    return sum(perft(apply_move(state, move), depth - 1) for move in moves)
+
+
+#* @brief Counts the positions reached after a number of plies, using the bitboard engine
+#*
+#* @param position position tuple
+#* @param depth number of plies
+#*
+#* @return number of leaf positions
+def perft_bitboard(position, depth):
+    if depth == 0:
+        return 1
+    if bitboard.is_terminal(position):
+        return 0
+    moves = bitboard.generate_moves(position)
+    if depth == 1:
+        return len(moves)
+    return sum(perft_bitboard(bitboard.apply_move(position, move), depth - 1) for move in moves)
+
+
+#* @brief Counts the positions reached through each legal move
+#*
+#* @param state current state of the game
+#* @param depth number of plies, including the root move
+#* @param engine "dict" for the rules in jd_gemini_new.py, "bitboard" for bitboard.py
+#*
+#* @return dictionary of move string -> number of leaf positions
+def divide(state, depth, engine="dict"):
+    counts = {}
+    if depth < 1 or is_terminal(state):
+        return counts
+    if engine == "bitboard":
+        position = bitboard.from_state(state)
+        side = position[5]
+        for move in bitboard.generate_moves(position):
+            counts[bitboard.move_to_string(move, side)] = perft_bitboard(bitboard.apply_move(position, move), depth - 1)
+    else:
+        for move in generate_moves(state, state["turn"]):
+            counts[move_to_string(move, state["turn"])] = perft(apply_move(state, move), depth - 1)
+    return counts
+
+
+#* @brief Runs perft on a state with the chosen engine
+#*
+#* @param state current state of the game
+#* @param depth number of plies
+#* @param engine "dict" or "bitboard"
+#*
+#* @return (number of leaf positions, seconds taken)
+def timed_perft(state, depth, engine="dict"):
+    start = time.perf_counter()
+    if engine == "bitboard":
+        nodes = perft_bitboard(bitboard.from_state(state), depth)
+    else:
+        nodes = perft(state, depth)
+    return nodes, time.perf_counter() - start
+
+
+#* @brief Plays a list of moves from the start of the game
+#*
+#* @param moves list of moves in the referee's text form
+#*
+#* @return state after the moves
+def state_after(moves):
+    state = initial_state()
+    state["turn"] = "blue"
+    for move in moves:
+        state = apply_move(state, parse_move(move))
+    return state
+
+
+#* @brief Checks every reference position against its stored counts
+#*
+#* @param reference reference data loaded from REFERENCE_PATH
+#* @param engines engines to check
+#* @param max_depth skip counts deeper than this, None to check them all
+#*
+#* @return number of mismatches
+def verify(reference, engines, max_depth=None):
+    mismatches = 0
+    for entry in reference["positions"]:
+        state = state_after(entry["moves"])
+        for depth, expected in enumerate(entry["counts"], 1):
+            if max_depth is not None and depth > max_depth:
+                break
+            for engine in engines:
+                nodes, elapsed = timed_perft(state, depth, engine)
+                status = "ok" if nodes == expected else "MISMATCH (expected {})".format(expected)
+                if nodes != expected:
+                    mismatches += 1
+                print("{:<12} depth {} {:<8} {:>10} nodes {:>10.0f} nodes/s  {}".format(
+                    entry["name"], depth, engine, nodes, nodes / max(elapsed, 1e-9), status))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count and time Lasker Morris move generation (perft)")
+    parser.add_argument("--depth", type=int, default=3, help="plies to count")
+    parser.add_argument("--moves", nargs="*", default=[], metavar="MOVE",
+                        help='moves from the start of the game to the position to count, e.g. "h1 d1 r0"')
+    parser.add_argument("--engine", choices=["dict", "bitboard"], default="dict", help="move generator to use")
+    parser.add_argument("--divide", action="store_true", help="show the count for each root move")
+    parser.add_argument("--verify", action="store_true", help="check the counts in the reference file with both engines")
+    parser.add_argument("--max-depth", type=int, help="with --verify, skip reference counts deeper than this")
+    parser.add_argument("--reference", default=REFERENCE_PATH, help="reference file for --verify")
+    args = parser.parse_args()
+
+    if args.verify:
+        with open(args.reference) as f:
+            reference = json.load(f)
+        mismatches = verify(reference, ["dict", "bitboard"], args.max_depth)
+        if mismatches:
+            sys.exit("{} perft mismatches".format(mismatches))
+        return
+
+    state = state_after(args.moves)
+    if args.divide:
+        counts = divide(state, args.depth, args.engine)
+        for move in sorted(counts):
+            print("{}: {}".format(move, counts[move]))
+        print("moves: {}".format(len(counts)))
+    nodes, elapsed = timed_perft(state, args.depth, args.engine)
+    print("nodes: {}  time: {:.3f}s  nodes/s: {:.0f}".format(nodes, elapsed, nodes / max(elapsed, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
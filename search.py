@@ -0,0 +1,506 @@
+import time
+import threading
+from array import array
+
+from jd_gemini_new import (
+    ADJACENCY,
+    copy_state, apply_move, generate_ordered_moves, has_any_move, is_legal_move, is_terminal, make_move, unmake_move,
+    forms_mill, count_board_pieces, mill_counter_ambiguous
+)
+from bitboard import MOVE_CODES, MOVE_CODE_OF, ORANGE, BLUE, move_to_tuple
+from symmetry import board_hashes, child_board_hashes, canonical_hash, transform_move, move_from_canonical
+
+# Max time the referee gives us for a move
+TIME_LIMIT = 2.0
+
+# Fraction of the time limit spent searching, the rest is kept for printing the move to the referee
+TIME_MARGIN = 0.9
+
+# Score of a won game, winning sooner scores higher (WIN_SCORE - ply)
+WIN_SCORE = 100000
+
+# Spaces with the most edges with other spaces
+STRATEGIC_POSITIONS = ("d2", "d6", "b4", "f4")
+
+# Expected ratio of the time of an iteration to that of the one before it, used to skip an iteration that
+# would not finish before the deadline
+ITERATION_GROWTH = 3
+
+# How many nodes are searched between checks of the clock
+NODES_PER_CLOCK_CHECK = 256
+
+# Most opponent replies searched ahead while pondering, the most likely ones first
+PONDER_REPLIES = 2
+
+# Depth of the quick search that ranks the opponent's replies before pondering on the most likely ones
+PONDER_RANK_DEPTH = 2
+
+
+# Number of buckets in the transposition table (two entries each), must be a power of two
+TABLE_BUCKETS = 1 << 16
+
+# Bound types of transposition table entries
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+#* @brief Converts a score to be stored in the transposition table, making win scores relative to the stored state
+#*
+#* @param score value of the state from the search
+#* @param ply distance from the root of the search
+#*
+#* @return score as stored in the table
+def score_to_table(score, ply):
+    if score >= WIN_SCORE - 1000:
+        return score + ply
+    if score <= -WIN_SCORE + 1000:
+        return score - ply
+    return score
+
+
+#* @brief Converts a score read from the transposition table back to the current distance from the root
+#*
+#* @param score value as stored in the table
+#* @param ply distance from the root of the search
+#*
+#* @return score of the state for the search
+def score_from_table(score, ply):
+    if score >= WIN_SCORE - 1000:
+        return score - ply
+    if score <= -WIN_SCORE + 1000:
+        return score + ply
+    return score
+
+
+class TranspositionTable:
+    #* @brief Creates a fixed-size table of search results keyed by the symmetry-independent hash of the state
+    #*
+    #* Symmetric states share one entry, whose best move is stored in the frame of the canonical state.
+    #* Each bucket has a depth-preferred entry, only replaced by searches at least as deep, and an
+    #* always-replace entry that takes everything else, so memory stays bounded however long the game runs.
+    #*
+    #* @param buckets number of buckets, must be a power of two
+    def __init__(self, buckets=TABLE_BUCKETS):
+        self.mask = buckets - 1
+        self.entries = [None] * (2 * buckets)
+
+    #* @brief Looks up the entry stored for a state
+    #*
+    #* @param key Zobrist hash of the state
+    #*
+    #* @return entry tuple (key, depth, score, bound, best move code), or None if the state is not stored
+    def probe(self, key):
+        index = (key & self.mask) << 1
+        entry = self.entries[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    #* @brief Stores the result of searching a state
+    #*
+    #* @param key Zobrist hash of the state
+    #* @param depth depth the state was searched to
+    #* @param score value found, already converted with score_to_table
+    #* @param bound EXACT, LOWER_BOUND or UPPER_BOUND
+    #* @param move code of the best move found (see bitboard.encode_move), or None
+    #*
+    #* @return void
+    def store(self, key, depth, score, bound, move):
+        index = (key & self.mask) << 1
+        entry = (key, depth, score, bound, move)
+        preferred = self.entries[index]
+        if preferred is None or preferred[0] == key or depth >= preferred[1]:
+            self.entries[index] = entry
+        else:
+            self.entries[index + 1] = entry
+
+    #* @brief Empties the table
+    #*
+    #* @return void
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+
+
+#* @brief Uses a series of heuristics to evaluate the value of the game state for the given player
+#*
+#* @param state current state of the game
+#* @param color color of the player
+#*
+#* @return the heuristic value of the game state (positive is good for the player)
+def evaluate(state, color):
+    opponent = "blue" if color == "orange" else "orange"
+    board = state["board"]
+    score = 0
+
+    # our number of pieces left vs opponent's number of pieces left
+    my_pieces_left = count_board_pieces(state, color) + state["hand"][color]
+    opp_pieces_left = count_board_pieces(state, opponent) + state["hand"][opponent]
+    score += 100 * (my_pieces_left - opp_pieces_left)
+
+    for pos, occ in board.items():
+        if occ is None:
+            # open spaces that would complete a mill for either player
+            if forms_mill(board, pos, color):
+                score += 50
+            if forms_mill(board, pos, opponent):
+                score -= 50
+            continue
+        sign = 1 if occ == color else -1
+        # free neighbouring spaces each piece could slide to
+        score += sign * 10 * sum(1 for n in ADJACENCY[pos] if board[n] is None)
+        if pos in STRATEGIC_POSITIONS:
+            score += sign * 20
+
+    return score
+
+
+#* @brief Scores a game state that has ended on pieces or stalemate, from the point of view of the player to move
+#*
+#* A player without moves also loses, the search finds that out when it runs out of moves to try.
+#*
+#* @param state current state of the game
+#* @param ply distance from the root of the search
+#*
+#* @return the score if the game is over, None otherwise
+def terminal_score(state, ply):
+    color = state["turn"]
+    opponent = "blue" if color == "orange" else "orange"
+    if count_board_pieces(state, color) + state["hand"][color] < 3:
+        return -WIN_SCORE + ply
+    if count_board_pieces(state, opponent) + state["hand"][opponent] < 3:
+        return WIN_SCORE - ply
+    if state["mill_counter"] >= 20:
+        return 0
+    return None
+
+
+class Searcher:
+    #* @brief Sets up a search that stops once the given deadline has passed
+    #*
+    #* @param deadline time.time() value at which the search must stop
+    #* @param max_depth deepest iteration to run, None for no limit
+    #* @param table transposition table to use, kept between moves by the caller (a new one if None)
+    #* @param tablebase endgame tablebase (tablebase.Tablebase) consulted before searching, or None
+    #* @param stop threading.Event that stops the search early when set, or None
+    def __init__(self, deadline, max_depth=None, table=None, tablebase=None, stop=None):
+        self.deadline = deadline
+        self.stop = stop
+        self.max_depth = max_depth
+        self.table = table if table is not None else TranspositionTable()
+        self.tablebase = tablebase
+        self.killers = {} # ply -> the last two quiet moves that caused a cutoff at that ply
+        self.history = array("l", [0]) * MOVE_CODES # move code -> how much it has been worth searching first so far
+        self.nodes = 0
+        self.iterations = [] # (depth, score, best move) of every depth completed by the last iterative_deepening call
+
+    #* @brief Raises SearchTimeout once the deadline has passed or the search is stopped (checked every NODES_PER_CLOCK_CHECK nodes)
+    #*
+    #* @return void
+    def check_time(self):
+        self.nodes += 1
+        if self.nodes % NODES_PER_CLOCK_CHECK == 0:
+            if time.time() >= self.deadline or (self.stop is not None and self.stop.is_set()):
+                raise SearchTimeout()
+
+    #* @brief Yields the moves of the player to move in the order they should be searched
+    #*
+    #* @param state current state of the game
+    #* @param first move to try before all others (the transposition table move), or None
+    #* @param ply distance from the root of the search
+    #*
+    #* @return generator of moves
+    def ordered_moves(self, state, first, ply):
+        if first is not None and is_legal_move(state, first):
+            yield first
+        for move in generate_ordered_moves(state, state["turn"], self.killers.get(ply, ()), self.history_score):
+            if move != first:
+                yield move
+
+    #* @brief Remembers a quiet move that caused a cutoff, so it is tried early in sibling positions
+    #*
+    #* @param move move that caused the cutoff
+    #* @param depth remaining depth where the cutoff happened
+    #* @param ply distance from the root of the search
+    #*
+    #* @return void
+    def record_cutoff(self, move, depth, ply):
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.history[MOVE_CODE_OF[move]] += depth * depth
+
+    #* @brief Looks up the history score of a move
+    #*
+    #* @param move tuple of the form (source, dest, removal)
+    #*
+    #* @return how much the move has been worth searching first so far
+    def history_score(self, move):
+        return self.history[MOVE_CODE_OF[move]]
+
+    #* @brief Negamax search with alpha-beta pruning, applying and taking back moves in place
+    #*
+    #* @param state current state of the game (restored before returning)
+    #* @param depth remaining depth of the search tree
+    #* @param alpha alpha value for pruning
+    #* @param beta beta value for pruning
+    #* @param ply distance from the root of the search
+    #* @param hashes board hashes of the state under every symmetry (see symmetry.board_hashes)
+    #*
+    #* @return the value of the state for the player to move
+    def negamax(self, state, depth, alpha, beta, ply, hashes):
+        self.check_time()
+        score = terminal_score(state, ply)
+        if score is not None:
+            return score
+
+        key, symmetry = canonical_hash(state, hashes)
+        table_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            if entry[4] is not None:
+                table_move = move_to_tuple(move_from_canonical(entry[4], symmetry),
+                                           ORANGE if state["turn"] == "orange" else BLUE)
+            if entry[1] >= depth:
+                score = score_from_table(entry[2], ply)
+                bound = entry[3]
+                if bound == EXACT:
+                    return score
+                if bound == LOWER_BOUND and score >= beta:
+                    return score
+                if bound == UPPER_BOUND and score <= alpha:
+                    return score
+
+        if depth == 0:
+            if not has_any_move(state, state["turn"]):
+                return -WIN_SCORE + ply
+            return evaluate(state, state["turn"])
+
+        original_alpha = alpha
+        best = -WIN_SCORE - 1
+        best_move = None
+        for move in self.ordered_moves(state, table_move, ply):
+            undo = make_move(state, move)
+            try:
+                score = -self.negamax(state, depth - 1, -beta, -alpha, ply + 1, child_board_hashes(hashes, undo))
+            finally:
+                unmake_move(state, undo)
+            if score > best:
+                best = score
+                best_move = move
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                if move[2] == "r0":
+                    self.record_cutoff(move, depth, ply)
+                break  # Cutoff
+
+        if best_move is None:
+            return -WIN_SCORE + ply  # No legal moves, we lose
+
+        if best <= original_alpha:
+            bound = UPPER_BOUND
+        elif best >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        if mill_counter_ambiguous(state["mill_counter"], depth):
+            depth = -1 # The score is not valid for every state sharing the hash, only keep the move for ordering
+        self.table.store(key, depth, score_to_table(best, ply), bound, transform_move(MOVE_CODE_OF[best_move], symmetry))
+        return best
+
+    #* @brief Searches every root move to the given depth
+    #*
+    #* @param state current state of the game
+    #* @param moves legal moves at the root, best guess first
+    #* @param depth depth of the search tree
+    #*
+    #* @return the value of the best move found and the move itself
+    def search_root(self, state, moves, depth):
+        alpha = -WIN_SCORE - 1
+        best_move = None
+        hashes = board_hashes(state)
+        for move in moves:
+            undo = make_move(state, move)
+            try:
+                score = -self.negamax(state, depth - 1, -WIN_SCORE - 1, -alpha, 1, child_board_hashes(hashes, undo))
+            finally:
+                unmake_move(state, undo)
+            if best_move is None or score > alpha:
+                alpha = score
+                best_move = move
+        return alpha, best_move
+
+    #* @brief Runs the search at increasing depths until time is up, keeping the result of the last completed depth
+    #*
+    #* A depth is not started when the time of the last one, times ITERATION_GROWTH, would take it past the deadline.
+    #* The (depth, score, move) result of every completed depth is also kept in self.iterations.
+    #*
+    #* @param state current state of the game
+    #* @param moves root moves to choose from, best guess first (all legal moves if None)
+    #*
+    #* @return the best move found, the value of it and the depth it was found at
+    def iterative_deepening(self, state, moves=None):
+        self.iterations = []
+        if self.tablebase is not None:
+            known = self.tablebase.best_move(state)
+            if known is not None:
+                move, result = known
+                return move, result * (WIN_SCORE - 1000), 0
+
+        state = copy_state(state)
+        moves = list(generate_ordered_moves(state, state["turn"]) if moves is None else moves)
+        if not moves:
+            return None, 0, 0
+        best_move, best_score, completed = moves[0], 0, 0
+
+        depth = 1
+        while self.max_depth is None or depth <= self.max_depth:
+            # Search the best move of the last depth first
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            start = time.time()
+            try:
+                score, move = self.search_root(state, moves, depth)
+            except SearchTimeout:
+                break
+            best_move, best_score, completed = move, score, depth
+            self.iterations.append((depth, score, move))
+            if abs(score) >= WIN_SCORE - depth:
+                break  # Forced win or loss found, deeper search will not change it
+            # Stop now rather than start a depth that would be cut off by the deadline before it finishes
+            now = time.time()
+            if now + (now - start) * ITERATION_GROWTH >= self.deadline:
+                break
+            depth += 1
+        return best_move, best_score, completed
+
+
+#* @brief Scores a single move with a search of the given depth, e.g. to check a move suggested by Gemini
+#*
+#* @param state current state of the game
+#* @param move move to score, in the form (source, dest, removal)
+#* @param depth depth of the search, including the move itself
+#* @param deadline time.time() value at which the search must stop
+#* @param table transposition table, sharing one with an earlier search of the same position makes this quick
+#*
+#* @return the score of the move for the player to move, or None if the deadline passed first
+def score_move(state, move, depth, deadline, table=None):
+    searcher = Searcher(deadline, depth, table)
+    try:
+        score, move = searcher.search_root(copy_state(state), [move], max(depth, 1))
+    except SearchTimeout:
+        return None
+    return score
+
+
+#* @brief Finds the best move for the player to move within the time limit
+#*
+#* @param state current state of the game
+#* @param time_limit seconds the referee allows for this move
+#* @param max_depth deepest iteration to run, None for no limit
+#* @param table transposition table kept between moves, None to start with an empty one
+#* @param tablebase endgame tablebase to play from when it covers the position, or None
+#*
+#* @return the best move found, or None if there is no legal move
+def iterative_deepening(state, time_limit=TIME_LIMIT, max_depth=None, table=None, tablebase=None):
+    searcher = Searcher(time.time() + time_limit * TIME_MARGIN, max_depth, table, tablebase)
+    move, score, depth = searcher.iterative_deepening(state)
+    return move
+
+
+class Ponderer:
+    #* @brief Sets up pondering: searching the opponent's likely replies in a background thread during their turn
+    #*
+    #* @param time_limit seconds of the opponent's turn spent pondering, shared by all replies (taken to be our own limit)
+    #* @param table transposition table shared with our own searches (they never run at the same time)
+    #* @param tablebase endgame tablebase, or None
+    #* @param replies most replies to search, the most likely ones first
+    def __init__(self, time_limit=TIME_LIMIT, table=None, tablebase=None, replies=PONDER_REPLIES):
+        self.time_limit = time_limit
+        self.table = table if table is not None else TranspositionTable()
+        self.tablebase = tablebase
+        self.replies = replies
+        self.answers = {} # (hash, mill_counter) of the position after a reply -> our best move there
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    #* @brief Starts pondering on the position after our move, while the opponent thinks
+    #*
+    #* @param state state of the game with the opponent to move
+    #*
+    #* @return void
+    def start(self, state):
+        self.stop()
+        self.answers = {}
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.ponder, args=(copy_state(state),), daemon=True)
+        self.thread.start()
+
+    #* @brief Searches our answer to each likely reply, most likely first, until stopped
+    #*
+    #* @param state state of the game with the opponent to move
+    #*
+    #* @return void
+    def ponder(self, state):
+        deadline = time.time() + self.time_limit * TIME_MARGIN
+        replies = self.rank_replies(state, deadline)
+        for count, reply in enumerate(replies):
+            if self.stop_event.is_set():
+                break
+            child = apply_move(state, reply)
+            # Split the time left between the replies still to search, one that finishes early leaves more for the rest
+            share = (deadline - time.time()) / (len(replies) - count)
+            searcher = Searcher(time.time() + share, None, self.table, self.tablebase, self.stop_event)
+            move, score, depth = searcher.iterative_deepening(child)
+            if move is not None and depth > 0 and not self.stop_event.is_set():
+                self.answers[(child["hash"], child["mill_counter"])] = move
+
+    #* @brief Ranks the opponent's replies with a shallow search and keeps the best ones for them
+    #*
+    #* @param state state of the game with the opponent to move
+    #* @param deadline time.time() value at which pondering must stop
+    #*
+    #* @return up to self.replies replies that do not end the game, the best for the opponent first
+    def rank_replies(self, state, deadline):
+        scored = []
+        # Searched in the search's move order, so the likeliest replies are ranked first if time runs short
+        for reply in generate_ordered_moves(state, state["turn"]):
+            if self.stop_event.is_set():
+                break
+            if is_terminal(apply_move(state, reply)):
+                continue
+            score = score_move(state, reply, PONDER_RANK_DEPTH, deadline, self.table)
+            if score is None:
+                break
+            scored.append((score, reply))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [reply for score, reply in scored[:self.replies]]
+
+    #* @brief Stops pondering and waits for the background thread to finish
+    #*
+    #* @return void
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    #* @brief Looks up the answer found while pondering for the position the opponent's move led to
+    #*
+    #* @param state current state of the game
+    #*
+    #* @return our move, or None if that position was not pondered
+    def lookup(self, state):
+        move = self.answers.get((state["hash"], state["mill_counter"]))
+        if move is not None and is_legal_move(state, move):
+            return move
+        return None
@@ -0,0 +1,219 @@
+from jd_gemini_new import VALID_SPACES, ZOBRIST_PIECES
+from bitboard import HAND, from_state
+
+# The board has 16 symmetries: the 8 rotations and reflections of the square, each with and without swapping
+# the inner and outer rings (the middle ring stays put). Symmetric positions play exactly the same, so
+# transposition tables, opening books and tablebases store one canonical representative and remember the
+# symmetry that maps the real position onto it, which also maps moves between the two.
+#
+# A symmetry is referred to by its index into SYMMETRIES; index 0 is the identity.
+
+
+#* @brief Works out the board position (column, row) of every space, with d4 at (0, 0)
+#*
+#* @return list of (x, y) coordinates, in the order of VALID_SPACES
+def _space_coordinates():
+    return [(ord(pos[0]) - ord("d"), int(pos[1]) - 4) for pos in VALID_SPACES]
+
+
+#* @brief Builds the 16 symmetries of the board as permutations of square indices
+#*
+#* @return list of permutations, permutation[sq] being the square sq is mapped to
+def _board_symmetries():
+    coordinates = _space_coordinates()
+    square_at = {xy: sq for sq, xy in enumerate(coordinates)}
+    geometric = [
+        lambda x, y: (x, y), lambda x, y: (-y, x), lambda x, y: (-x, -y), lambda x, y: (y, -x),
+        lambda x, y: (-x, y), lambda x, y: (x, -y), lambda x, y: (y, x), lambda x, y: (-y, -x)
+    ]
+
+    def swap_rings(x, y):
+        ring = max(abs(x), abs(y))
+        if ring == 3:
+            return (x // 3, y // 3)
+        if ring == 1:
+            return (x * 3, y * 3)
+        return (x, y)
+
+    symmetries = []
+    for transform in geometric:
+        for swap in (False, True):
+            permutation = []
+            for x, y in coordinates:
+                x, y = transform(x, y)
+                if swap:
+                    x, y = swap_rings(x, y)
+                permutation.append(square_at[(x, y)])
+            symmetries.append(permutation)
+    return symmetries
+
+
+SYMMETRIES = _board_symmetries()
+
+# INVERSES[t] is the symmetry that undoes symmetry t
+INVERSES = [
+    next(u for u, other in enumerate(SYMMETRIES) if all(other[permutation[sq]] == sq for sq in range(24)))
+    for permutation in SYMMETRIES
+]
+
+
+#* @brief Builds lookup tables that apply a permutation to a mask one byte at a time
+#*
+#* @param permutation list giving the image of every square
+#*
+#* @return three lists of 256 masks, for the low, middle and high byte of a mask
+def _byte_tables(permutation):
+    tables = []
+    for shift in (0, 8, 16):
+        table = []
+        for byte in range(256):
+            mask = 0
+            for bit in range(8):
+                if byte >> bit & 1:
+                    mask |= 1 << permutation[shift + bit]
+            table.append(mask)
+        tables.append(table)
+    return tables
+
+
+SYMMETRY_TABLES = [_byte_tables(permutation) for permutation in SYMMETRIES]
+
+# Square images with the move sentinel HAND/NO_REMOVAL left in place, for mapping move codes
+_MOVE_SQUARES = [permutation + [HAND] for permutation in SYMMETRIES]
+
+# For every space and colour, the Zobrist key of that piece after each symmetry
+SYMMETRIC_ZOBRIST = {
+    pos: {
+        color: tuple(ZOBRIST_PIECES[VALID_SPACES[permutation[sq]]][color] for permutation in SYMMETRIES)
+        for color in ("blue", "orange")
+    }
+    for sq, pos in enumerate(VALID_SPACES)
+}
+
+
+#* @brief Applies a symmetry to a bitboard
+#*
+#* @param mask bitboard of squares
+#* @param symmetry index into SYMMETRIES
+#*
+#* @return the mapped bitboard
+def transform_mask(mask, symmetry):
+    low, middle, high = SYMMETRY_TABLES[symmetry]
+    return low[mask & 255] | middle[mask >> 8 & 255] | high[mask >> 16]
+
+
+#* @brief Applies a symmetry to a move code (see bitboard.encode_move)
+#*
+#* @param move move code
+#* @param symmetry index into SYMMETRIES
+#*
+#* @return the mapped move code
+def transform_move(move, symmetry):
+    squares = _MOVE_SQUARES[symmetry]
+    return squares[move & 31] | squares[move >> 5 & 31] << 5 | squares[move >> 10] << 10
+
+
+#* @brief Finds the canonical (smallest) form of a pair of bitboards under the board symmetries
+#*
+#* @param first bitboard compared first (e.g. the pieces of the player to move)
+#* @param second bitboard breaking ties
+#*
+#* @return (first, second, symmetry) of the canonical form and the symmetry that maps onto it
+def canonical_masks(first, second):
+    best_first = best_second = None
+    best_symmetry = 0
+    f0, f1, f2 = first & 255, first >> 8 & 255, first >> 16
+    s0, s1, s2 = second & 255, second >> 8 & 255, second >> 16
+    for symmetry, (low, middle, high) in enumerate(SYMMETRY_TABLES):
+        image = low[f0] | middle[f1] | high[f2]
+        if best_first is None or image < best_first:
+            best_first = image
+            best_second = low[s0] | middle[s1] | high[s2]
+            best_symmetry = symmetry
+        elif image == best_first:
+            image = low[s0] | middle[s1] | high[s2]
+            if image < best_second:
+                best_second = image
+                best_symmetry = symmetry
+    return best_first, best_second, best_symmetry
+
+
+#* @brief Finds the canonical form of a bitboard position
+#*
+#* @param position position tuple (see bitboard.py)
+#*
+#* @return (canonical position, symmetry that maps the position onto it)
+def canonical_position(position):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    blue, orange, symmetry = canonical_masks(blue, orange)
+    return (blue, orange, blue_hand, orange_hand, mill_counter, turn), symmetry
+
+
+#* @brief Finds the canonical form of a game state
+#*
+#* @param state current state of the game
+#*
+#* @return (canonical position tuple, symmetry that maps the state onto it)
+def canonicalize_state(state):
+    return canonical_position(from_state(state))
+
+
+#* @brief Packs a position into a single integer, usable as a key in tables and files
+#*
+#* @param position position tuple
+#*
+#* @return 58-bit key: both masks, both hands, side to move and whether the stalemate count is close
+def position_key(position):
+    blue, orange, blue_hand, orange_hand, mill_counter, turn = position
+    return blue | orange << 24 | blue_hand << 48 | orange_hand << 52 | turn << 56 | (mill_counter >= 16) << 57
+
+
+#* @brief Computes the Zobrist hash of the board under every symmetry
+#*
+#* @param state current state of the game
+#*
+#* @return list of 16 hashes, the first one matches the board part of state["hash"]
+def board_hashes(state):
+    hashes = [0] * len(SYMMETRIES)
+    for pos, occ in state["board"].items():
+        if occ is not None:
+            hashes = [h ^ k for h, k in zip(hashes, SYMMETRIC_ZOBRIST[pos][occ])]
+    return hashes
+
+
+#* @brief Updates the symmetric board hashes for a move applied by make_move
+#*
+#* @param hashes board hashes before the move
+#* @param undo undo record returned by make_move
+#*
+#* @return list of board hashes after the move
+def child_board_hashes(hashes, undo):
+    (source, dest, removal), removed, hand, mill_counter, color = undo[:5]
+    hashes = [h ^ k for h, k in zip(hashes, SYMMETRIC_ZOBRIST[dest][color])]
+    if not source.startswith("h"):
+        hashes = [h ^ k for h, k in zip(hashes, SYMMETRIC_ZOBRIST[source][color])]
+    if removed is not None:
+        hashes = [h ^ k for h, k in zip(hashes, SYMMETRIC_ZOBRIST[removal][removed])]
+    return hashes
+
+
+#* @brief Computes a hash that is the same for every symmetric version of the state
+#*
+#* @param state current state of the game (with an up to date state["hash"])
+#* @param hashes board hashes of the state from board_hashes/child_board_hashes
+#*
+#* @return (canonical hash, symmetry that maps the state onto its canonical form)
+def canonical_hash(state, hashes):
+    board_key = min(hashes)
+    # The hands, mill_counter and turn parts of the hash do not change under a symmetry
+    return board_key ^ state["hash"] ^ hashes[0], hashes.index(board_key)
+
+
+#* @brief Maps a move of the canonical form back onto the real position
+#*
+#* @param move move code in the canonical frame
+#* @param symmetry symmetry that maps the real position onto the canonical one
+#*
+#* @return move code in the frame of the real position
+def move_from_canonical(move, symmetry):
+    return transform_move(move, INVERSES[symmetry])
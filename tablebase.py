@@ -0,0 +1,479 @@
+import os
+import sys
+import mmap
+import time
+import random
+import argparse
+from collections import deque
+from math import comb
+
+from bitboard import (
+    BLUE, FULL_BOARD, NEIGHBOURS, NO_REMOVAL,
+    bit_squares, forms_mill, get_mill_removals, from_state, to_state, encode_move, move_to_tuple, move_from_tuple,
+    apply_move, is_terminal
+)
+from symmetry import SYMMETRY_TABLES, canonical_masks
+
+# Endgame tablebase for positions where both hands are empty and both players have few pieces left.
+#
+# A table covers one material balance "AvB": the player to move has A pieces on the board and the other
+# player has B. Positions are stored from the point of view of the player to move (colour does not matter),
+# one byte per position, at the combinatorial index of (own pieces, other pieces). Only the canonical
+# position of each group of symmetric positions (see symmetry.py) is solved and stored, so probes
+# canonicalise first.
+#
+# Each byte holds the result and the distance to mill: the number of plies until the mill that decides
+# the game (for a loss, the longest the loser can hold out before the winner's mill).
+#
+#     0          draw (or not stored)
+#     2 * d + 1  win, the winning mill is closed d plies from now
+#     2 * d + 2  loss, the other player closes the winning mill d plies from now
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# Tables solved when the generator is run without --materials
+DEFAULT_MATERIALS = ["3v3"]
+
+# Directory the tables are written to and read from
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+
+# Largest distance to mill that fits in a byte
+MAX_DISTANCE = 126
+
+
+#* @brief Number of positions in the table of a material balance
+#*
+#* @param own_count pieces of the player to move
+#* @param opp_count pieces of the other player
+#*
+#* @return table size in bytes
+def table_size(own_count, opp_count):
+    return comb(24, own_count) * comb(24 - own_count, opp_count)
+
+
+#* @brief Ranks a set of squares among all sets of the same size (combinatorial number system)
+#*
+#* @param mask bitboard of squares
+#*
+#* @return rank of the set
+def _rank(mask):
+    rank = 0
+    k = 1
+    for sq in bit_squares(mask):
+        rank += comb(sq, k)
+        k += 1
+    return rank
+
+
+#* @brief Finds the index of a position within the table of its material balance
+#*
+#* @param own bitboard of the pieces of the player to move
+#* @param opp bitboard of the other player's pieces
+#*
+#* @return byte offset into the table
+def table_index(own, opp):
+    # Number the other player's pieces among the squares not taken by the player to move
+    compressed = 0
+    for sq in bit_squares(opp):
+        compressed |= 1 << (sq - (own & ((1 << sq) - 1)).bit_count())
+    return _rank(own) * comb(24 - own.bit_count(), opp.bit_count()) + _rank(compressed)
+
+
+#* @brief Turns a stored byte into a result and distance to mill
+#*
+#* @param value byte from a table
+#*
+#* @return (WIN, LOSS or DRAW, distance to mill)
+def decode_value(value):
+    if value == 0:
+        return DRAW, 0
+    if value & 1:
+        return WIN, (value - 1) // 2
+    return LOSS, (value - 2) // 2
+
+
+#* @brief Turns a result and distance to mill into a byte to store
+#*
+#* @param result WIN or LOSS
+#* @param distance plies until the deciding mill
+#*
+#* @return byte for the table
+def encode_value(result, distance):
+    distance = min(distance, MAX_DISTANCE)
+    return 2 * distance + 1 if result == WIN else 2 * distance + 2
+
+
+#* @brief Lists every canonical position of a material balance
+#*
+#* @param own_count pieces of the player to move
+#* @param opp_count pieces of the other player
+#*
+#* @return generator of (own, opp) bitboards
+def canonical_positions(own_count, opp_count):
+    for squares in _combinations(FULL_BOARD, own_count):
+        own = squares
+        images = [low[own & 255] | middle[own >> 8 & 255] | high[own >> 16] for low, middle, high in SYMMETRY_TABLES]
+        if min(images) != own:
+            continue
+        stabiliser = [SYMMETRY_TABLES[i] for i, image in enumerate(images) if image == own]
+        for opp in _combinations(FULL_BOARD & ~own, opp_count):
+            if all(low[opp & 255] | middle[opp >> 8 & 255] | high[opp >> 16] >= opp for low, middle, high in stabiliser):
+                yield own, opp
+
+
+#* @brief Lists every subset of a given size of the squares in a mask
+#*
+#* @param mask bitboard of the squares to choose from
+#* @param count number of squares to choose
+#*
+#* @return generator of bitboards
+def _combinations(mask, count):
+    if count == 0:
+        yield 0
+        return
+    for sq in bit_squares(mask):
+        rest = mask & ~((2 << sq) - 1)
+        for tail in _combinations(rest, count - 1):
+            yield (1 << sq) | tail
+
+
+class TablebaseGenerator:
+    #* @brief Sets up retrograde analysis, solving each material balance after the ones it can reach by a mill
+    #*
+    #* @param log function used to report progress
+    def __init__(self, log=print):
+        self.tables = {}
+        self.log = log
+
+    #* @brief Looks up a position in a table that has already been solved
+    #*
+    #* @param own bitboard of the pieces of the player to move
+    #* @param opp bitboard of the other player's pieces
+    #*
+    #* @return the stored byte
+    def lookup(self, own, opp):
+        own, opp, symmetry = canonical_masks(own, opp)
+        return self.tables[(own.bit_count(), opp.bit_count())][table_index(own, opp)]
+
+    #* @brief Lists the distinct canonical positions reachable without a mill, and the results of the mill moves
+    #*
+    #* @param own bitboard of the pieces of the player to move
+    #* @param opp bitboard of the other player's pieces
+    #*
+    #* @return (set of successor table indices, best mill result for the player to move, any move at all)
+    def successors(self, own, opp):
+        empty = FULL_BOARD & ~(own | opp)
+        flying = own.bit_count() == 3
+        opp_count = opp.bit_count()
+        indices = set()
+        best_exit = None
+        any_move = False
+        for src in bit_squares(own):
+            rest = own & ~(1 << src)
+            for dest in bit_squares(empty if flying else NEIGHBOURS[src] & empty):
+                any_move = True
+                new_own = rest | 1 << dest
+                if not forms_mill(rest, dest):
+                    indices.add(table_index(*canonical_masks(opp, new_own)[:2]))
+                    continue
+                if opp_count == 3:
+                    return indices, WIN, True  # Taking a piece leaves the other player with 2
+                for rem in get_mill_removals(opp):
+                    result, distance = decode_value(self.lookup(opp & ~(1 << rem), new_own))
+                    result = -result
+                    if best_exit is None or result > best_exit:
+                        best_exit = result
+                    if result == WIN:
+                        return indices, WIN, True
+        return indices, best_exit, any_move
+
+    #* @brief Lists the distinct canonical positions that lead to a position by a move without a mill
+    #*
+    #* @param own bitboard of the pieces of the player to move
+    #* @param opp bitboard of the other player's pieces
+    #*
+    #* @return set of predecessor table indices (in the table with the material reversed)
+    def predecessors(self, own, opp):
+        empty = FULL_BOARD & ~(own | opp)
+        flying = opp.bit_count() == 3
+        indices = set()
+        for dest in bit_squares(opp):
+            rest = opp & ~(1 << dest)
+            if forms_mill(rest, dest):
+                continue  # The move would have closed a mill, that position belongs to another table
+            for src in bit_squares(empty if flying else NEIGHBOURS[dest] & empty):
+                indices.add((rest | 1 << src, own))
+        return {table_index(*canonical_masks(p_own, p_opp)[:2]) for p_own, p_opp in indices}
+
+    #* @brief Solves one material balance together with its reverse (moves without a mill swap between them)
+    #*
+    #* @param own_count pieces of the player to move
+    #* @param opp_count pieces of the other player
+    #*
+    #* @return void
+    def solve(self, own_count, opp_count):
+        materials = [(own_count, opp_count)]
+        if own_count != opp_count:
+            materials.append((opp_count, own_count))
+        start = time.time()
+        values = {m: bytearray(table_size(*m)) for m in materials}
+        counts = {m: bytearray(table_size(*m)) for m in materials}
+        positions = {m: {} for m in materials}
+        queue = deque()
+        for material in materials:
+            self.tables[material] = values[material]
+
+        # Positions decided by their own moves
+        initial = []
+        for material in materials:
+            for own, opp in canonical_positions(*material):
+                index = table_index(own, opp)
+                positions[material][index] = (own, opp)
+                indices, best_exit, any_move = self.successors(own, opp)
+                if best_exit == WIN:
+                    values[material][index] = encode_value(WIN, 1)
+                    initial.append((1, material, index))
+                elif not indices and best_exit != DRAW:
+                    distance = 1 if any_move else 0
+                    values[material][index] = encode_value(LOSS, distance)
+                    initial.append((distance, material, index))
+                else:
+                    # A drawing mill keeps one successor that can never be a win for the other player
+                    counts[material][index] = len(indices) + (best_exit == DRAW)
+        initial.sort(key=lambda item: item[0])
+        queue.extend((material, index) for distance, material, index in initial)
+        self.log("{}: {} positions, {} decided directly ({:.0f}s)".format(
+            ", ".join("{}v{}".format(*m) for m in materials), sum(len(p) for p in positions.values()),
+            len(initial), time.time() - start))
+
+        # Walk back from decided positions in order of distance
+        while queue:
+            material, index = queue.popleft()
+            result, distance = decode_value(values[material][index])
+            own, opp = positions[material][index]
+            previous = (material[1], material[0])
+            for p_index in self.predecessors(own, opp):
+                if values[previous][p_index]:
+                    continue
+                if result == LOSS:
+                    values[previous][p_index] = encode_value(WIN, distance + 1)
+                    queue.append((previous, p_index))
+                else:
+                    counts[previous][p_index] -= 1
+                    if counts[previous][p_index] == 0:
+                        values[previous][p_index] = encode_value(LOSS, distance + 1)
+                        queue.append((previous, p_index))
+
+        for material in materials:
+            decided = sum(1 for index in positions[material] if values[material][index])
+            self.log("{}v{}: {} of {} positions won or lost ({:.0f}s)".format(
+                material[0], material[1], decided, len(positions[material]), time.time() - start))
+
+    #* @brief Solves a material balance, first solving the ones its mills lead to
+    #*
+    #* @param own_count pieces of the player to move
+    #* @param opp_count pieces of the other player
+    #*
+    #* @return void
+    def solve_with_dependencies(self, own_count, opp_count):
+        if (own_count, opp_count) in self.tables:
+            return
+        if opp_count > 3:
+            self.solve_with_dependencies(opp_count - 1, own_count)
+        if own_count > 3:
+            self.solve_with_dependencies(own_count - 1, opp_count)
+        self.solve(own_count, opp_count)
+
+    #* @brief Writes every solved table to disk
+    #*
+    #* @param directory directory to write the tables to
+    #*
+    #* @return void
+    def write(self, directory=TABLE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        for (own_count, opp_count), values in self.tables.items():
+            with open(table_path(own_count, opp_count, directory), "wb") as f:
+                f.write(values)
+
+
+#* @brief Path of the file holding a material balance
+#*
+#* @param own_count pieces of the player to move
+#* @param opp_count pieces of the other player
+#* @param directory directory of the tables
+#*
+#* @return file path
+def table_path(own_count, opp_count, directory=TABLE_DIR):
+    return os.path.join(directory, "tb_{}v{}.bin".format(own_count, opp_count))
+
+
+class Tablebase:
+    #* @brief Opens the tables found in a directory, each is memory-mapped the first time it is probed
+    #*
+    #* @param directory directory of the tables
+    def __init__(self, directory=TABLE_DIR):
+        self.directory = directory
+        self.maps = {}
+
+    #* @brief Memory-maps the table of a material balance
+    #*
+    #* @param material (own_count, opp_count)
+    #*
+    #* @return the mapped table, or None if it has not been generated
+    def table(self, material):
+        if material not in self.maps:
+            path = table_path(material[0], material[1], self.directory)
+            if os.path.exists(path) and os.path.getsize(path) == table_size(*material):
+                with open(path, "rb") as f:
+                    self.maps[material] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.maps[material] = None
+        return self.maps[material]
+
+    #* @brief Looks up a position given by the bitboards of both players
+    #*
+    #* @param own bitboard of the pieces of the player to move
+    #* @param opp bitboard of the other player's pieces
+    #*
+    #* @return (WIN, LOSS or DRAW, distance to mill) for the player to move, or None if no table covers it
+    def probe_masks(self, own, opp):
+        own_count, opp_count = own.bit_count(), opp.bit_count()
+        if opp_count < 3:
+            return WIN, 0
+        if own_count < 3:
+            return LOSS, 0
+        table = self.table((own_count, opp_count))
+        if table is None:
+            return None
+        own, opp, symmetry = canonical_masks(own, opp)
+        return decode_value(table[table_index(own, opp)])
+
+    #* @brief Looks up a game state
+    #*
+    #* @param state current state of the game
+    #*
+    #* @return (WIN, LOSS or DRAW, distance to mill) for the player to move, or None if no table covers it
+    def probe(self, state):
+        blue, orange, blue_hand, orange_hand, mill_counter, turn = from_state(state)
+        if blue_hand or orange_hand:
+            return None
+        own, opp = (blue, orange) if turn == BLUE else (orange, blue)
+        if opp.bit_count() < 3:
+            return None  # The game is already over
+        return self.probe_masks(own, opp)
+
+    #* @brief Picks the move that keeps the best tablebase result for the player to move
+    #*
+    #* Wins are played out by the shortest distance to mill, losses are held off as long as possible, and a
+    #* win that cannot be reached before the 20 move stalemate is treated as a draw.
+    #*
+    #* @param state current state of the game
+    #*
+    #* @return (move in the form (source, dest, removal), result), or None if no table covers the position
+    def best_move(self, state):
+        if self.probe(state) is None:
+            return None
+        blue, orange, blue_hand, orange_hand, mill_counter, turn = from_state(state)
+        own, opp = (blue, orange) if turn == BLUE else (orange, blue)
+        empty = FULL_BOARD & ~(own | opp)
+        flying = own.bit_count() == 3
+        best = None
+        for src in bit_squares(own):
+            rest = own & ~(1 << src)
+            for dest in bit_squares(empty if flying else NEIGHBOURS[src] & empty):
+                new_own = rest | 1 << dest
+                if forms_mill(rest, dest):
+                    options = [(encode_move(src, dest, rem), opp & ~(1 << rem), 0) for rem in get_mill_removals(opp)]
+                else:
+                    options = [(encode_move(src, dest, NO_REMOVAL), opp, mill_counter + 1)]
+                for move, new_opp, counter in options:
+                    child = self.probe_masks(new_opp, new_own)
+                    if child is None:
+                        return None  # A table this position can reach is missing
+                    result, distance = -child[0], child[1] + 1
+                    # The winning mill is closed distance - 1 plies after this move, from a position whose
+                    # counter is counter + distance - 2 (counter is 0 after a mill): the game is stalemated
+                    # first if that counter has reached 20
+                    if result == WIN and counter + distance - 2 >= 20:
+                        result = DRAW
+                    # Prefer better results, then quicker wins and slower losses
+                    rank = (result, -distance if result == WIN else distance)
+                    if best is None or rank > best[0]:
+                        best = (rank, move)
+        if best is None:
+            return None
+        return move_to_tuple(best[1], turn), best[0][0]
+
+
+#* @brief Checks where best_move draws the line between a win and the 20 move stalemate, on random won 3v3 positions
+#*
+#* A position won at distance d with the counter at 20 - d closes its winning mill from a position whose counter
+#* is 19, so it must still be played out to a win; with the counter one higher it must be called a draw.
+#*
+#* @param tablebase Tablebase holding the 3v3 table
+#* @param samples won positions to check
+#* @param seed seed of the random positions
+#*
+#* @return list of descriptions of every failure, or None if the 3v3 table is missing
+def check_stalemate_boundary(tablebase, samples=20, seed=0):
+    if tablebase.table((3, 3)) is None:
+        return None
+    rng = random.Random(seed)
+    failures = []
+    checked = 0
+    while checked < samples:
+        squares = rng.sample(range(24), 6)
+        blue = sum(1 << sq for sq in squares[:3])
+        orange = sum(1 << sq for sq in squares[3:])
+        result, distance = tablebase.probe_masks(blue, orange)
+        if result != WIN or distance < 2:
+            continue
+        checked += 1
+
+        position = (blue, orange, 0, 0, 20 - distance, BLUE)
+        while not is_terminal(position):
+            move = tablebase.best_move(to_state(position))[0]
+            position = apply_move(position, move_from_tuple(move))
+        if position[1].bit_count() >= 3:
+            failures.append("{:06x}/{:06x}: win at distance {} with counter {} was not played out".format(
+                blue, orange, distance, 20 - distance))
+        late = tablebase.best_move(to_state((blue, orange, 0, 0, 21 - distance, BLUE)))[1]
+        if late != DRAW:
+            failures.append("{:06x}/{:06x}: win at distance {} with counter {} is not a draw".format(
+                blue, orange, distance, 21 - distance))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Lasker Morris endgame tablebases by retrograde analysis")
+    parser.add_argument("--materials", nargs="+", default=DEFAULT_MATERIALS,
+                        help="material balances to solve, e.g. 3v3 4v3 (their dependencies are solved too)")
+    parser.add_argument("--out-dir", default=TABLE_DIR, help="directory to write the tables to")
+    parser.add_argument("--check", action="store_true",
+                        help="instead of generating, check the stalemate handling of the 3v3 table in --out-dir")
+    args = parser.parse_args()
+
+    if args.check:
+        failures = check_stalemate_boundary(Tablebase(args.out_dir))
+        if failures is None:
+            sys.exit("No 3v3 table in {}".format(args.out_dir))
+        for failure in failures:
+            print(failure)
+        if failures:
+            sys.exit("{} stalemate boundary failures".format(len(failures)))
+        print("stalemate boundary ok")
+        return
+
+    generator = TablebaseGenerator()
+    for material in args.materials:
+        own_count, opp_count = (int(n) for n in material.lower().split("v"))
+        if own_count < 3 or opp_count < 3:
+            sys.exit("Every player needs at least 3 pieces: {}".format(material))
+        generator.solve_with_dependencies(own_count, opp_count)
+    generator.write(args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import time
 import random
 import copy
 
+import debug_log
+
 
 TIME_LIMIT = 2.0
 
@@ -63,9 +65,11 @@ MILLS = [
     ["e4", "f4", "g4"]
 ]
 
-def log_debug(message):
-    with open("randomdebug.txt", "a") as f:
-        f.write(message + "\n")
+MILL_PARTNERS = {pos: [tuple(p for p in mill if p != pos) for mill in MILLS if pos in mill] for pos in VALID_SPACES}
+
+# Debug log, written by a background thread (see debug_log.py) so logging never blocks a move
+DEBUG_LOG_PATH = "randomdebug.txt"
+log_debug = debug_log.open_log(DEBUG_LOG_PATH)
 
 def initial_state():
     state = {
@@ -77,11 +81,9 @@ def initial_state():
     return state
 
 def forms_mill(board, pos, color):
-    for mill in MILLS:
-        if pos in mill:
-            if all(board[p] == color or p == pos for p in mill):
-                if all((p == pos) or (board[p] == color) for p in mill):
-                    return True
+    for first, second in MILL_PARTNERS[pos]:
+        if board[first] == color and board[second] == color:
+            return True
     return False
 
 def get_mill_removals(state, opponent_color):
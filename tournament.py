@@ -0,0 +1,368 @@
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import testlm
+import mock_llm
+from jd_gemini_new import (
+    PLAYER_MODES, LLM_MOVES,
+    initial_state, copy_state, is_legal_move, make_move, is_terminal, count_board_pieces, add_opening_book,
+    close_player, add_llm_arguments, check_llm_arguments, add_log_arguments, configure_logging
+)
+
+# Self-play tournament runner: plays many games between two players in-process, spread over worker
+# processes, and reports the result from the point of view of the first player. Players are built with the
+# same functions the player script uses (see PLAYER_MODES in jd_gemini_new.py), plus the random player from
+# testlm.py, and are refereed with the rules in jd_gemini_new.py, so no referee or pipes are involved.
+#
+# The players swap colours every game. A player that returns an illegal move (or no move) loses the game,
+# like it would with the referee.
+#
+# The Gemini and hybrid players talk to the offline stand-in from mock_llm.py unless --llm-backend gemini is
+# given, so their move latency and retry behaviour can be measured without a network. They get their own time
+# limit (--llm-time-limit), as the search players' default is too short for any request to be made, and the
+# moves where they fell back on a random or search move instead of Gemini's are counted.
+#
+# With --ponder, a pondering player is run in a process of its own, so its background search does not take
+# the GIL from its opponent during the opponent's turn.
+
+
+#* @brief Returns a function that plays a random legal move, using the testlm.py player
+#*
+#* @param player_color color of the player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning a move
+def make_random_player(player_color, args):
+    def choose_move(state, opp_move):
+        move = testlm.get_random_move(state, player_color)
+        if move is None:
+            return None
+        # testlm writes placements as ("h", dest, removal), convert them the way the referee would
+        return testlm.parse_move(testlm.move_to_string(move, player_color))
+
+    return choose_move
+
+
+# Players that can take part in a tournament; parallel search players are left out as every game would start
+# its own pool of processes inside a tournament worker
+TOURNAMENT_PLAYERS = {name: make_player for name, make_player in PLAYER_MODES.items() if name != "parallel"}
+TOURNAMENT_PLAYERS["random"] = make_random_player
+
+# Players that ask the LLM for their moves, and play with --llm-time-limit instead of --time-limit
+LLM_PLAYERS = {"gemini", "hybrid"}
+
+# Players that search during the opponent's turn with --ponder, and are then run in a process of their own
+PONDERING_PLAYERS = {"search"}
+
+
+#* @brief Works out who won a finished game
+#*
+#* @param state final state of the game
+#*
+#* @return color of the winner, or None for a draw
+def game_winner(state):
+    for color, other in (("blue", "orange"), ("orange", "blue")):
+        if count_board_pieces(state, color) + state["hand"][color] < 3:
+            return other
+    if state["mill_counter"] >= 20:
+        return None
+    if is_terminal(state):
+        return "orange" if state["turn"] == "blue" else "blue" # The player to move is stuck
+    return None
+
+
+#* @brief Plays one game between two players
+#*
+#* @param game (game number, player name for blue, player name for orange, parsed command line arguments)
+#*
+#* @return dictionary with the winning color (None for a draw), the number of plies, the reason the game
+#*         ended, the seconds each color spent on each of its moves, the mock LLM requests and faults and
+#*         how the LLM players' moves were decided
+def play_game(game):
+    number, blue_name, orange_name, args = game
+    random.seed(args.seed + number)
+    # Workers play several games, only this game's share of the counts is returned
+    mock_stats = mock_llm.STATS.copy()
+    llm_moves = LLM_MOVES.copy()
+    result = play_moves(blue_name, orange_name, args)
+    result["mock_stats"] = dict(mock_llm.STATS - mock_stats)
+    result["llm_moves"] = dict(LLM_MOVES - llm_moves)
+    return result
+
+
+#* @brief Gives a player the time limit of its kind
+#*
+#* @param name player name
+#* @param args parsed command line arguments
+#*
+#* @return arguments to build the player with
+def player_args(name, args):
+    if name not in LLM_PLAYERS:
+        return args
+    llm_args = argparse.Namespace(**vars(args))
+    llm_args.time_limit = args.llm_time_limit
+    return llm_args
+
+
+#* @brief Builds a player for one game
+#*
+#* @param name player name
+#* @param color color of the player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning a move
+def make_player(name, color, args):
+    choose_move = TOURNAMENT_PLAYERS[name](color, player_args(name, args))
+    if not args.no_book and name != "random":
+        choose_move = add_opening_book(choose_move, args)
+    return choose_move
+
+
+#* @brief Plays the moves asked for through a pipe, in the process started by start_player_process
+#*
+#* @param connection end of the pipe the (state, opponent's last move) requests arrive on, None ends the game
+#* @param name player name
+#* @param color color of the player
+#* @param args parsed command line arguments
+#*
+#* @return void
+def serve_player(connection, name, color, args):
+    choose_move = make_player(name, color, args)
+    connection.send(None) # Ready, building the player is not timed as part of its first move
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            connection.send(choose_move(*request))
+    finally:
+        close_player(choose_move)
+        connection.close()
+
+
+#* @brief Starts a player in a process of its own, so threads it runs between moves do not slow its opponent down
+#*
+#* @param name player name
+#* @param color color of the player
+#* @param args parsed command line arguments
+#*
+#* @return function taking (state, opponent's last move) and returning a move, whose close attribute ends the process
+def start_player_process(name, color, args):
+    connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve_player, args=(child_connection, name, color, args), daemon=True)
+    process.start()
+    child_connection.close()
+    connection.recv()
+
+    def choose_move(state, opp_move):
+        connection.send((state, opp_move))
+        return connection.recv()
+
+    def close():
+        try:
+            connection.send(None)
+        except OSError:
+            pass # The process has already ended
+        process.join()
+        connection.close()
+
+    choose_move.close = close
+    return choose_move
+
+
+#* @brief Plays the moves of one game between two players
+#*
+#* @param blue_name player name for blue
+#* @param orange_name player name for orange
+#* @param args parsed command line arguments
+#*
+#* @return dictionary with the winning color (None for a draw), the number of plies, the reason the game
+#*         ended and the seconds each color spent on each of its moves
+def play_moves(blue_name, orange_name, args):
+    players = {}
+    for color, name in (("blue", blue_name), ("orange", orange_name)):
+        if args.ponder and name in PONDERING_PLAYERS:
+            players[color] = start_player_process(name, color, args)
+        else:
+            players[color] = make_player(name, color, args)
+    try:
+        return play_turns(players, args)
+    finally:
+        # Stop background searches before the next game starts in this worker
+        for choose_move in players.values():
+            close_player(choose_move)
+
+
+#* @brief Plays the turns of a game until it is over
+#*
+#* @param players dictionary of color -> function taking (state, opponent's last move) and returning a move
+#* @param args parsed command line arguments
+#*
+#* @return dictionary with the winning color (None for a draw), the number of plies, the reason the game
+#*         ended and the seconds each color spent on each of its moves
+def play_turns(players, args):
+    state = initial_state()
+    state["turn"] = "blue"
+    opp_move = "none, this is the first move of the game"
+    move_times = {"blue": [], "orange": []}
+    plies = 0
+    while not is_terminal(state):
+        if plies >= args.max_plies:
+            return {"winner": None, "plies": plies, "reason": "ply limit", "move_times": move_times}
+        color = state["turn"]
+        start = time.perf_counter()
+        move = players[color](copy_state(state), opp_move)
+        move_times[color].append(time.perf_counter() - start)
+        if move is None or not is_legal_move(state, tuple(move)):
+            winner = "orange" if color == "blue" else "blue"
+            return {"winner": winner, "plies": plies, "reason": "illegal move", "move_times": move_times}
+        make_move(state, tuple(move))
+        opp_move = move
+        plies += 1
+
+    winner = game_winner(state)
+    reason = "stalemate" if winner is None else "win"
+    return {"winner": winner, "plies": plies, "reason": reason, "move_times": move_times}
+
+
+#* @brief Converts a score fraction into an Elo rating difference
+#*
+#* @param score points per game (1 for a win, 0.5 for a draw)
+#*
+#* @return Elo difference implied by the score, infinite for a score of 0 or 1
+def elo_difference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+#* @brief Plays a tournament and totals the results from the point of view of the first player
+#*
+#* @param args parsed command line arguments
+#*
+#* @return dictionary of totals
+def run_tournament(args):
+    games = []
+    for number in range(args.games):
+        if number % 2 == 0:
+            games.append((number, args.player_a, args.player_b, args))
+        else:
+            games.append((number, args.player_b, args.player_a, args))
+
+    start = time.time()
+    with ProcessPoolExecutor(args.workers, initializer=configure_logging, initargs=(args,)) as pool:
+        results = list(pool.map(play_game, games))
+    elapsed = time.time() - start
+
+    totals = {"wins": 0, "draws": 0, "losses": 0, "plies": 0, "reasons": {}, "move_times": {"a": [], "b": []},
+              "mock_stats": {}, "llm_moves": {}}
+    for (number, blue_name, orange_name, game_args), result in zip(games, results):
+        a_color = "blue" if number % 2 == 0 else "orange"
+        b_color = "orange" if a_color == "blue" else "blue"
+        if result["winner"] is None:
+            totals["draws"] += 1
+        elif result["winner"] == a_color:
+            totals["wins"] += 1
+        else:
+            totals["losses"] += 1
+        totals["plies"] += result["plies"]
+        totals["reasons"][result["reason"]] = totals["reasons"].get(result["reason"], 0) + 1
+        totals["move_times"]["a"].extend(result["move_times"][a_color])
+        totals["move_times"]["b"].extend(result["move_times"][b_color])
+        for counts in ("mock_stats", "llm_moves"):
+            for name, count in result[counts].items():
+                totals[counts][name] = totals[counts].get(name, 0) + count
+    totals["elapsed"] = elapsed
+    return totals
+
+
+#* @brief Picks a percentile out of sorted values
+#*
+#* @param values sorted list of values
+#* @param fraction percentile as a fraction, e.g. 0.95
+#*
+#* @return the value below which the given fraction of the values lie
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+#* @brief Prints the totals of a tournament
+#*
+#* @param args parsed command line arguments
+#* @param totals totals from run_tournament
+#*
+#* @return void
+def report(args, totals):
+    games = args.games
+    score = (totals["wins"] + totals["draws"] / 2) / games
+    # 95% interval of the Elo difference from the spread of the per-game scores
+    variance = (totals["wins"] * (1 - score) ** 2 + totals["draws"] * (0.5 - score) ** 2 + totals["losses"] * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    low, high = elo_difference(score - margin), elo_difference(score + margin)
+
+    print("{} vs {}: {} games in {:.1f}s".format(args.player_a, args.player_b, games, totals["elapsed"]))
+    print("  {} wins, {} draws, {} losses (score {:.3f})".format(totals["wins"], totals["draws"], totals["losses"], score))
+    print("  Elo difference: {:+.1f} (95% interval {:+.1f} to {:+.1f})".format(elo_difference(score), low, high))
+    print("  average game length: {:.1f} plies".format(totals["plies"] / games))
+    print("  game endings: {}".format(", ".join("{} {}".format(n, reason) for reason, n in sorted(totals["reasons"].items()))))
+    print("  moves per second: {:.1f} overall".format(totals["plies"] / totals["elapsed"]))
+    for player, name in (("a", args.player_a), ("b", args.player_b)):
+        times = sorted(totals["move_times"][player])
+        if times:
+            print("  {} move time: mean {:.1f} ms, median {:.1f} ms, 95th percentile {:.1f} ms, max {:.1f} ms".format(
+                name, 1000 * sum(times) / len(times), 1000 * percentile(times, 0.5), 1000 * percentile(times, 0.95), 1000 * times[-1]))
+    if not LLM_PLAYERS & {args.player_a, args.player_b}:
+        return
+    moves = totals["llm_moves"]
+    fallbacks = moves.get("no answer", 0) + moves.get("invalid", 0) + moves.get("outscored", 0)
+    print("  LLM moves: {} answered, {} cached, {} fallbacks ({} no answer, {} invalid, {} outscored by the search)".format(
+        moves.get("answered", 0), moves.get("cached", 0), fallbacks,
+        moves.get("no answer", 0), moves.get("invalid", 0), moves.get("outscored", 0)))
+    if fallbacks and not moves.get("answered", 0) + moves.get("cached", 0):
+        print("  WARNING: the LLM never gave a move that was played, the results measure the fallbacks only")
+    stats = totals["mock_stats"]
+    if args.llm_backend == "mock":
+        print("  mock LLM: {} requests, {} rate limited, {} malformed, {} replayed, {} synthesised".format(
+            stats.get("requests", 0), stats.get("rate_limited", 0), stats.get("malformed", 0), stats.get("replayed", 0), stats.get("synthesised", 0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a Lasker Morris tournament between two players without the referee")
+    parser.add_argument("player_a", choices=sorted(TOURNAMENT_PLAYERS), help="player the results are reported for")
+    parser.add_argument("player_b", choices=sorted(TOURNAMENT_PLAYERS), help="opponent")
+    parser.add_argument("--games", type=int, default=100, help="number of games, the players swap colours every game")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes playing games (default: one per core, one per two cores with --ponder)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, game n is played with seed + n")
+    parser.add_argument("--max-plies", type=int, default=1000, help="plies after which a game is called a draw")
+    parser.add_argument("--time-limit", type=float, default=0.1, help="seconds per move for the search players")
+    parser.add_argument("--llm-time-limit", type=float, default=2.0,
+                        help="seconds per move for the gemini and hybrid players (the referee's default)")
+    parser.add_argument("--ponder", action="store_true",
+                        help="search players search the opponent's likely replies during their turn, in a process of their own")
+    parser.add_argument("--tablebase-dir", help="directory of the endgame tables from tablebase.py (default: tablebases/ next to this file)")
+    parser.add_argument("--book", help="opening book from opening_book.py (default: opening_book.bin next to this file)")
+    parser.add_argument("--no-book", action="store_true", help="do not play from the opening book")
+    add_llm_arguments(parser, backend="mock")
+    add_log_arguments(parser, level="off")
+    args = parser.parse_args()
+    check_llm_arguments(parser, args)
+    if args.games < 1:
+        sys.exit("--games must be at least 1")
+    if args.ponder and args.workers is None:
+        # Leave a core for each game's pondering process, so the opponent is not slowed down by it
+        args.workers = max(1, (os.cpu_count() or 1) // 2)
+
+    report(args, run_tournament(args))
+
+
+if __name__ == "__main__":
+    main()